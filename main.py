@@ -1,30 +1,54 @@
 import streamlit as st
 import imaplib
+import ssl
 import email
+import email.utils
 import re
 import requests
 import json
 import os
-import base64
 from datetime import datetime, timedelta, date
 from typing import List, Dict, Optional
 import pandas as pd
 import plotly.express as px
-import plotly.graph_objects as go
-from collections import Counter
-import os
+from collections import OrderedDict
 from dotenv import load_dotenv
-import dateutil.parser
-import calendar
-from streamlit_tags import st_tags
 import numpy as np
-from io import StringIO
 from bs4 import BeautifulSoup
-import pytz
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import threading
 import time
 import hashlib
+import random
+import tempfile
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# selectolax's C tokenizer strips HTML much faster than BeautifulSoup; optional
+try:
+    from selectolax.parser import HTMLParser
+except ImportError:
+    HTMLParser = None
+
+# pyahocorasick matches all fallback category keywords in a single pass; optional
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+# orjson parses and serializes API payloads several times faster than the stdlib; optional
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def json_loads(data):
+    """Parse JSON from str or bytes, using orjson when installed"""
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+def json_dumps_bytes(obj) -> bytes:
+    """Serialize to UTF-8 JSON bytes, using orjson when installed"""
+    return orjson.dumps(obj) if orjson is not None else json.dumps(obj).encode()
 
 # Load environment variables
 load_dotenv('.secret')
@@ -286,19 +310,29 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# Text patterns shared by the categorizer, tracker and extractor, compiled once at import
+_HTML_TAG_RE = re.compile(r'(?:<[^>]+>|\s)+')  # tag/whitespace runs collapse to one space in one pass
+_WHITESPACE_RE = re.compile(r'\s+')
+_NON_ALNUM_RE = re.compile(r'[^a-zA-Z0-9]')
+_DIGIT_RE = re.compile(r'\d')
+_DIGITS_RE = re.compile(r'\d+')
+
+# Built once per process: loading the CA bundle for every IMAP connection is the slow part of a TLS setup
+_IMAP_SSL_CONTEXT = ssl.create_default_context()
+
 class UserStatisticsManager:
     """Manages user statistics and analytics"""
     
     def __init__(self):
         self.stats_file = 'user_statistics.json'
+        self.users_file = 'tracked_users.json'
         self.stats = self._load_statistics()
     
     def _load_statistics(self) -> Dict:
         """Load statistics from file"""
         try:
-            if os.path.exists(self.stats_file):
-                with open(self.stats_file, 'r') as f:
-                    return json.load(f)
+            with open(self.stats_file, 'rb') as f:
+                return json_loads(f.read())
         except Exception:
             pass
         
@@ -309,34 +343,41 @@ class UserStatisticsManager:
             'last_updated': None
         }
     
+    def _write_json(self, path: str, data, **dump_kwargs):
+        """Write JSON through a temp file and rename it into place, so readers never see a partial file"""
+        # A unique temp name per write, so sessions saving at the same time don't clobber each other
+        with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(os.path.abspath(path)),
+                                         prefix=f"{os.path.basename(path)}.", suffix='.tmp', delete=False) as f:
+            json.dump(data, f, **dump_kwargs)
+        os.replace(f.name, path)
+    
     def _save_statistics(self):
         """Save statistics to file"""
         try:
             self.stats['last_updated'] = datetime.now().isoformat()
-            with open(self.stats_file, 'w') as f:
-                json.dump(self.stats, f, indent=2)
+            self._write_json(self.stats_file, self.stats, indent=2)
         except Exception as e:
             print(f"Error saving statistics: {e}")
     
+    def _load_tracked_users(self) -> set:
+        """Load the tracked user set from file"""
+        try:
+            with open(self.users_file, 'rb') as f:
+                return set(json_loads(f.read()))
+        except (OSError, ValueError):
+            return set()
+    
     def record_user_session(self, user_email: str):
         """Record a new user session"""
-        users_file = 'tracked_users.json'
-        tracked_users = set()
-        
-        try:
-            if os.path.exists(users_file):
-                with open(users_file, 'r') as f:
-                    tracked_users = set(json.load(f))
-        except Exception:
-            pass
+        # Read fresh at each login: other sessions may have added users since this manager was created
+        tracked_users = self._load_tracked_users()
         
         if user_email not in tracked_users:
             tracked_users.add(user_email)
             self.stats['total_users'] = len(tracked_users)
             
             try:
-                with open(users_file, 'w') as f:
-                    json.dump(list(tracked_users), f)
+                self._write_json(self.users_file, list(tracked_users))
             except Exception:
                 pass
             
@@ -368,7 +409,6 @@ class ConfigManager:
     
     def __init__(self):
         self.config = self._load_config()
-        self.validation_errors = []
     
     def _load_config(self) -> Dict[str, str]:
         """Load configuration from environment variables"""
@@ -382,12 +422,13 @@ class ConfigManager:
     
     def validate_config(self) -> bool:
         """Validate required configuration"""
-        self.validation_errors = []
+        # A local list: one instance is shared by every session, so validation keeps no state on it
+        validation_errors = []
         
         if not self.config.get('REPLICATE_API_TOKEN'):
-            self.validation_errors.append("Missing Replicate API Token")
+            validation_errors.append("Missing Replicate API Token")
         
-        return len(self.validation_errors) == 0
+        return len(validation_errors) == 0
     
     def get_config_value(self, key: str) -> Optional[str]:
         """Get configuration value by key"""
@@ -405,28 +446,169 @@ class ConfigManager:
                 ```
                 """)
 
+@st.cache_resource
+def get_config_manager() -> ConfigManager:
+    """Shared ConfigManager; the environment it reads is loaded once when the app starts"""
+    return ConfigManager()
+
+# Keyword rules for the offline categorizer; order breaks ties between equally matched categories
+_FALLBACK_CATEGORY_MAPPING = {
+    'food delivery': {'keywords': ('zomato', 'swiggy', 'uber eats', 'foodpanda', 'delivery', 'dominos', 'pizza', 'kfc', 'mcdonalds'), 'color': '#FF6B35'},
+    'restaurants': {'keywords': ('restaurant', 'dining', 'cafe', 'coffee', 'starbucks', 'ccd', 'bistro'), 'color': '#F7931E'},
+    'grocery stores': {'keywords': ('grocery', 'supermarket', 'big bazaar', 'dmart', 'reliance fresh', 'more', 'store'), 'color': '#4CAF50'},
+    'ride sharing': {'keywords': ('uber', 'ola', 'taxi', 'cab', 'ride'), 'color': '#000000'},
+    'fuel & petrol': {'keywords': ('petrol', 'diesel', 'fuel', 'gas', 'hp', 'bharat petroleum', 'iocl'), 'color': '#FF4444'},
+    'online shopping': {'keywords': ('amazon', 'flipkart', 'myntra', 'jabong', 'snapdeal', 'online', 'ecommerce'), 'color': '#FF5722'},
+    'streaming services': {'keywords': ('netflix', 'prime video', 'hotstar', 'disney', 'youtube', 'spotify'), 'color': '#E50914'},
+    'saas services': {'keywords': ('google cloud', 'aws', 'azure', 'office 365', 'adobe', 'dropbox'), 'color': '#4285F4'},
+    'pharmacy': {'keywords': ('pharmacy', 'medical', 'medicine', 'drug', 'apollo', 'netmeds'), 'color': '#4CAF50'},
+    'atm withdrawal': {'keywords': ('atm', 'withdrawal', 'cash', 'withdraw'), 'color': '#795548'},
+    'money transfer': {'keywords': ('transfer', 'upi', 'neft', 'rtgs', 'imps', 'paytm', 'phonepe', 'gpay'), 'color': '#2196F3'},
+    'electricity bill': {'keywords': ('electricity', 'power', 'current bill', 'bescom', 'kseb'), 'color': '#FFC107'},
+    'internet & telecom': {'keywords': ('internet', 'broadband', 'wifi', 'airtel', 'jio', 'bsnl', 'mobile bill'), 'color': '#9C27B0'},
+}
+
+# Each distinct fallback keyword with every category that lists it
+_KEYWORD_CATEGORIES = {}
+for _category, _info in _FALLBACK_CATEGORY_MAPPING.items():
+    for _keyword in _info['keywords']:
+        _KEYWORD_CATEGORIES.setdefault(_keyword, []).append(_category)
+_KEYWORD_CATEGORIES = {keyword: tuple(categories) for keyword, categories in _KEYWORD_CATEGORIES.items()}
+
+# Without pyahocorasick the keywords are still found in one scan: at every position the lookahead
+# captures the longest keyword starting there, and the shorter keywords starting at the same spot
+# are exactly its prefixes, which are looked up rather than matched
+_KEYWORD_SCAN_RE = re.compile(
+    '(?=(' + '|'.join(re.escape(keyword) for keyword in sorted(_KEYWORD_CATEGORIES, key=len, reverse=True)) + '))'
+)
+_KEYWORD_PREFIXES = {
+    keyword: tuple(other for other in _KEYWORD_CATEGORIES if other != keyword and keyword.startswith(other))
+    for keyword in _KEYWORD_CATEGORIES
+}
+
+# Streamlit re-executes this script on every rerun; cache_resource keeps one automaton per process
+@st.cache_resource
+def _build_category_automaton():
+    """Compile every fallback keyword into one Aho-Corasick automaton, if pyahocorasick is installed"""
+    if ahocorasick is None:
+        return None
+    
+    automaton = ahocorasick.Automaton()
+    for keyword, categories in _KEYWORD_CATEGORIES.items():
+        automaton.add_word(keyword, (keyword, categories))
+    automaton.make_automaton()
+    return automaton
+
+_CATEGORY_AUTOMATON = _build_category_automaton()
+
 class AITransactionCategorizer:
     """AI-powered transaction categorization with unlimited categories"""
     
+    # Parser patterns are compiled once per process instead of on every email
+    _JSON_OBJECT_RE = re.compile(r'\{.*\}', re.DOTALL)
+    _JSON_ARRAY_RE = re.compile(r'\[.*\]', re.DOTALL)
+    _NON_NUMERIC_RE = re.compile(r'[^\d.]')
+    
+    # Distinct keywords a lone matching category needs before the model is skipped for an email
+    _LOCAL_MIN_KEYWORDS = 2
+    
+    # Templates remembered by the analysis cache; the least recently used are evicted first
+    _ANALYSIS_CACHE_SIZE = 2048
+    
+    # Wording that marks a charge as a trial; the keyword fallback also counts promos
+    _TRIAL_KEYWORDS = ('trial', 'free', 'test', 'demo', 'preview', 'beta')
+    _FALLBACK_TRIAL_KEYWORDS = _TRIAL_KEYWORDS + ('promo',)
+    
+    # Merchant names and wording that mark a transaction as a subscription
+    _SUBSCRIPTION_INDICATORS = frozenset({
+        'netflix', 'prime video', 'disney', 'hotstar', 'zee5', 'youtube', 'spotify', 'apple music',
+        'adobe', 'microsoft', 'google workspace', 'zoom', 'slack', 'notion', 'dropbox',
+        'aws', 'azure', 'google cloud', 'digitalocean',
+        'subscription', 'monthly', 'yearly', 'recurring', 'auto-renewal'
+    })
+    
+    # Improved color palette for better distribution
+    _COLOR_PALETTE = (
+        '#E50914', '#4285F4', '#FF6B35', '#4CAF50', '#9C27B0', '#FF5722',
+        '#00BCD4', '#FFC107', '#795548', '#607D8B', '#3F51B5', '#009688',
+        '#8BC34A', '#CDDC39', '#FFEB3B', '#FF9800', '#FF5252', '#536DFE',
+        '#1DB954', '#00A3E0', '#F7931E', '#FF4444', '#6C5CE7', '#74B9FF',
+        '#A29BFE', '#FD79A8', '#FDCB6E', '#6C757D', '#E17055', '#2D3436'
+    )
+    
+    # Predefined colors for common services (keys already lowercase)
+    _SERVICE_COLORS = {
+        'netflix': '#E50914',
+        'youtube': '#FF0000',
+        'spotify': '#1DB954',
+        'google cloud': '#4285F4',
+        'microsoft': '#0078D4',
+        'adobe': '#FF0000',
+        'amazon': '#FF9900',
+        'uber': '#000000',
+        'zomato': '#E23744',
+        'swiggy': '#FC8019',
+        'food delivery': '#FF6B35',
+        'streaming services': '#E50914',
+        'saas services': '#4285F4',
+        'cloud platform': '#4285F4',
+        'video streaming': '#E50914',
+        'music streaming': '#1DB954'
+    }
+    
+    _VENDOR_PATTERNS = tuple(re.compile(pattern, re.IGNORECASE | re.MULTILINE) for pattern in (
+        r'(?:at|@)\s+([A-Za-z][A-Za-z0-9\s&.-]{2,30})(?:\s|$|,|\.|;)',
+        r'(?:paid to|payment to|transfer to)\s+([A-Za-z][A-Za-z0-9\s&.-]{2,30})(?:\s|$|,|\.|;)',
+        r'(?:merchant|store|shop):\s*([A-Za-z][A-Za-z0-9\s&.-]{2,30})(?:\s|$|,|\.|;)',
+        r'(?:purchase from|bought from)\s+([A-Za-z][A-Za-z0-9\s&.-]{2,30})(?:\s|$|,|\.|;)',
+        r'([A-Z][A-Z0-9\s&.-]{3,25})\s+(?:store|shop|restaurant|cafe)',
+        r'(?:^|\s)([A-Z][a-z]+(?:\s[A-Z][a-z]+)*)\s+(?:payment|transaction)',
+    ))
+    
+    # Amount patterns in priority order, compiled once per process instead of on every email
+    _AMOUNT_PATTERNS = tuple(re.compile(pattern, re.IGNORECASE) for pattern in (
+        r'(?:Rs\.?\s*|₹\s*)(\d+(?:,\d+)*(?:\.\d{1,2})?)',
+        r'(?:INR\s*)(\d+(?:,\d+)*(?:\.\d{1,2})?)',
+        r'(?:\$|USD\s*)(\d+(?:,\d+)*(?:\.\d{1,2})?)',
+        r'(?:Amount\s*:?\s*Rs\.?\s*|Amount\s*:?\s*₹\s*)(\d+(?:,\d+)*(?:\.\d{1,2})?)',
+        r'(?:Amount\s*:?\s*)(\d+(?:,\d+)*(?:\.\d{1,2})?)',
+        r'(?:Debited|Credited|Withdrawn).*?(?:Rs\.?\s*|₹\s*)(\d+(?:,\d+)*(?:\.\d{1,2})?)',
+        r'(?:Debited|Credited|Withdrawn).*?(\d+(?:,\d+)*(?:\.\d{1,2})?)',
+        r'(?:^|\s)(\d{1,8}\.\d{2})(?:\s|$)',
+        r'(?:^|\s)(\d{2,8})(?:\s|$)'
+    ))
+    
+    # Fields requested from the model, shared by the single- and multi-email prompts
+    _ANALYSIS_FIELDS = """    "amount": "numeric amount only (e.g. 895.62) or null",
+    "vendor": "actual merchant/store name from transaction details",
+    "category": "specific category based on vendor context",
+    "color": "appropriate hex color for category",
+    "confidence": 0-100,
+    "is_subscription": true/false,
+    "subscription_type": "streaming/saas/food_delivery/telecom/etc or null",
+    "billing_cycle": "monthly/quarterly/yearly or null",
+    "service_logo": "appropriate emoji for service",
+    "is_trial": true/false"""
+    
     def __init__(self, replicate_token: str):
         self.replicate_token = replicate_token
+        
+        # One pooled session for every create/poll request so concurrent workers reuse TLS connections;
+        # rate-limit and gateway errors on polls are retried by the adapter (POSTs are never replayed)
+        self.session = requests.Session()
+        retry = Retry(total=3, backoff_factor=0.2, status_forcelist=[429, 500, 502, 503, 504])
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32, max_retries=retry)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({"Authorization": f"Bearer {replicate_token}"})
         self.category_colors = {}
         self.vendor_cache = {}
-        self.subscription_indicators = {
-            'netflix', 'prime video', 'disney', 'hotstar', 'zee5', 'youtube', 'spotify', 'apple music',
-            'adobe', 'microsoft', 'google workspace', 'zoom', 'slack', 'notion', 'dropbox',
-            'aws', 'azure', 'google cloud', 'digitalocean',
-            'subscription', 'monthly', 'yearly', 'recurring', 'auto-renewal'
-        }
         
-        # Improved color palette for better distribution
-        self.color_palette = [
-            '#E50914', '#4285F4', '#FF6B35', '#4CAF50', '#9C27B0', '#FF5722',
-            '#00BCD4', '#FFC107', '#795548', '#607D8B', '#3F51B5', '#009688',
-            '#8BC34A', '#CDDC39', '#FFEB3B', '#FF9800', '#FF5252', '#536DFE',
-            '#1DB954', '#00A3E0', '#F7931E', '#FF4444', '#6C5CE7', '#74B9FF',
-            '#A29BFE', '#FD79A8', '#FDCB6E', '#6C757D', '#E17055', '#2D3436'
-        ]
+        # Model analyses keyed by email template; alerts that differ only in amounts,
+        # dates or account digits reuse one Replicate prediction. Entries hold vendors and amounts
+        # from this user's emails, so the cache lives and dies with the login's categorizer
+        self.analysis_cache = OrderedDict()
+        self.analysis_cache_lock = threading.Lock()
+        
         self.color_index = 0
         
         # Initialize with predefined service colors
@@ -434,43 +616,28 @@ class AITransactionCategorizer:
     
     def _initialize_service_colors(self):
         """Initialize with predefined colors for common services"""
-        predefined_colors = {
-            'netflix': '#E50914',
-            'youtube': '#FF0000',
-            'spotify': '#1DB954',
-            'google cloud': '#4285F4',
-            'microsoft': '#0078D4',
-            'adobe': '#FF0000',
-            'amazon': '#FF9900',
-            'uber': '#000000',
-            'zomato': '#E23744',
-            'swiggy': '#FC8019',
-            'food delivery': '#FF6B35',
-            'streaming services': '#E50914',
-            'saas services': '#4285F4',
-            'cloud platform': '#4285F4',
-            'video streaming': '#E50914',
-            'music streaming': '#1DB954'
-        }
-        
-        for service, color in predefined_colors.items():
-            self.category_colors[service.lower()] = color
+        self.category_colors.update(self._SERVICE_COLORS)
     
     def get_next_color(self) -> str:
         """Get next color from palette"""
-        color = self.color_palette[self.color_index % len(self.color_palette)]
+        color = self._COLOR_PALETTE[self.color_index % len(self._COLOR_PALETTE)]
         self.color_index += 1
         return color
     
     def clean_html_content(self, html_content: str) -> str:
         """Clean HTML content and extract meaningful text"""
         try:
-            soup = BeautifulSoup(html_content, 'html.parser')
-            
-            for script in soup(["script", "style"]):
-                script.decompose()
-            
-            text = soup.get_text()
+            if HTMLParser is not None:
+                tree = HTMLParser(html_content)
+                tree.strip_tags(['script', 'style'])
+                text = tree.text()
+            else:
+                soup = BeautifulSoup(html_content, 'html.parser')
+                
+                for script in soup(["script", "style"]):
+                    script.decompose()
+                
+                text = soup.get_text()
             lines = (line.strip() for line in text.splitlines())
             chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
             text = ' '.join(chunk for chunk in chunks if chunk)
@@ -478,137 +645,283 @@ class AITransactionCategorizer:
             return text[:1200]
             
         except Exception:
-            clean_text = re.sub(r'<[^>]+>', ' ', html_content)
-            clean_text = re.sub(r'\s+', ' ', clean_text).strip()
+            clean_text = _HTML_TAG_RE.sub(' ', html_content).strip()
             return clean_text[:1200]
     
-    def analyze_transaction_complete(self, subject: str, body: str, bank_name: str) -> Dict:
-        """Complete AI analysis of transaction"""
-        try:
-            url = "https://api.replicate.com/v1/models/openai/gpt-4.1-nano/predictions"
-            
-            headers = {
-                "Authorization": f"Bearer {self.replicate_token}",
-                "Content-Type": "application/json"
+    def _cache_analysis(self, template_key: bytes, analysis: Dict):
+        """Store a template's analysis, evicting the least recently used entry when full (lock held)"""
+        self.analysis_cache[template_key] = analysis
+        self.analysis_cache.move_to_end(template_key)
+        if len(self.analysis_cache) > self._ANALYSIS_CACHE_SIZE:
+            self.analysis_cache.popitem(last=False)
+    
+    def _template_key(self, subject: str, body: str) -> bytes:
+        """Fingerprint an email's template by masking the digits that vary between alerts"""
+        normalized = _WHITESPACE_RE.sub(' ', _DIGITS_RE.sub('#', f"{subject} {body}".lower()))
+        return hashlib.blake2b(normalized.encode(), digest_size=16).digest()
+    
+    def _run_prediction(self, prompt: str, max_tokens: int) -> Optional[str]:
+        """Create a Replicate prediction for prompt and return its text output"""
+        url = "https://api.replicate.com/v1/models/openai/gpt-4.1-nano/predictions"
+        
+        # Prefer: wait holds the request open until the prediction finishes (up to 60s),
+        # so short completions come back without any polling round-trips
+        headers = {
+            "Content-Type": "application/json",
+            "Prefer": "wait"
+        }
+        
+        data = {
+            "input": {
+                "prompt": prompt,
+                "system_prompt": "You are an expert transaction analyzer. Extract vendor details from bank email content, identify subscriptions, detect trials (amounts under ₹10 or keywords like 'trial', 'free', 'test'). Return only valid JSON.",
+                "max_tokens": max_tokens,
+                "temperature": 0.2
             }
+        }
+        
+        response = self.session.post(url, headers=headers, data=json_dumps_bytes(data))
+        
+        if response.status_code in (200, 201):
+            prediction = json_loads(response.content)
             
-            subject_clean = subject[:100]
-            body_clean = self.clean_html_content(body)
+            if prediction.get('status') == 'succeeded':
+                output = prediction.get('output') or []
+                return ''.join(output).strip() or None
+            if prediction.get('status') in ('failed', 'canceled'):
+                return None
             
-            prompt = f"""Analyze this bank transaction email from {bank_name}:
+            # Still running when the wait window closed
+            return self.poll_prediction(prediction['id'])
+        
+        return None
+    
+    def _request_analysis(self, subject: str, body: str, bank_name: str) -> Optional[Dict]:
+        """Run the Replicate prediction and return the parsed JSON analysis"""
+        body_clean = self.clean_html_content(body)
+        
+        prompt = f"""Analyze this bank transaction email from {bank_name}:
 
 Email Content: {body_clean}
 
 Extract and return ONLY this JSON:
 {{
-    "amount": "numeric amount only (e.g. 895.62) or null",
-    "vendor": "actual merchant/store name from transaction details",
-    "category": "specific category based on vendor context",
-    "color": "appropriate hex color for category",
-    "confidence": 0-100,
-    "is_subscription": true/false,
-    "subscription_type": "streaming/saas/food_delivery/telecom/etc or null",
-    "billing_cycle": "monthly/quarterly/yearly or null",
-    "service_logo": "appropriate emoji for service",
-    "is_trial": true/false
+{self._ANALYSIS_FIELDS}
 }}"""
+        
+        result = self._run_prediction(prompt, 400)
+        
+        if result:
+            try:
+                json_match = self._JSON_OBJECT_RE.search(result.strip())
+                if json_match:
+                    json_str = json_match.group(0)
+                    return json_loads(json_str)
+                return json_loads(result.strip())
+            except json.JSONDecodeError:
+                pass
+        
+        return None
+    
+    def _request_batch_analysis(self, emails: List[tuple]) -> Optional[List[Dict]]:
+        """Analyze several emails with one prediction; unmatched emails come back as None, or None overall"""
+        emails_text = "\n\n".join(
+            f"Email {number} (from {bank_name}):\n{self.clean_html_content(body)}"
+            for number, (subject, body, bank_name) in enumerate(emails, 1)
+        )
+        
+        prompt = f"""Analyze these {len(emails)} bank transaction emails:
+
+{emails_text}
+
+Return ONLY a JSON array with one object per email, in input order, each shaped like:
+{{
+    "id": email number,
+{self._ANALYSIS_FIELDS}
+}}"""
+        
+        result = self._run_prediction(prompt, 400 * len(emails))
+        if not result:
+            return None
+        
+        try:
+            json_match = self._JSON_ARRAY_RE.search(result)
+            analyses = json_loads(json_match.group(0) if json_match else result.strip())
+        except json.JSONDecodeError:
+            return None
+        
+        if not isinstance(analyses, list):
+            return None
+        analyses = [analysis for analysis in analyses if isinstance(analysis, dict)]
+        
+        # Prefer the ids the model echoed back, keeping whichever emails it did answer;
+        # array order is only trusted when the reply has exactly one object per email
+        numbers = range(1, len(emails) + 1)
+        by_id = {analysis.get('id'): analysis for analysis in analyses}
+        if by_id.keys() & set(numbers):
+            return [by_id.get(number) for number in numbers]
+        if len(analyses) == len(emails):
+            return analyses
+        return None
+    
+    def analyze_transactions_batch(self, emails: List[tuple]) -> List[Dict]:
+        """Analyze (subject, body, bank_name) emails, sending unseen templates in one shared prediction"""
+        analyses = [None] * len(emails)
+        
+        # Each email is lowercased and masked into its template key once, then the key is passed along
+        template_keys = [self._template_key(subject, body) for subject, body, _ in emails]
+        
+        # Only the first email of each template not already cached goes to the model;
+        # the rest are served from the template cache by analyze_transaction_complete
+        pending, pending_keys = [], set()
+        with self.analysis_cache_lock:
+            for index, template_key in enumerate(template_keys):
+                if template_key not in self.analysis_cache and template_key not in pending_keys:
+                    pending.append(index)
+                    pending_keys.add(template_key)
+        
+        # Emails the keyword scan settles on its own never reach the model
+        local_analyses = {}
+        for index in pending:
+            local_analysis = self._local_analysis(*emails[index])
+            if local_analysis is not None:
+                local_analyses[index] = local_analysis
+        pending = [index for index in pending if index not in local_analyses]
+        
+        if len(pending) > 1:
+            try:
+                batch_analyses = self._request_batch_analysis([emails[index] for index in pending])
+            except Exception:
+                batch_analyses = None
             
-            data = {
-                "input": {
-                    "prompt": prompt,
-                    "system_prompt": "You are an expert transaction analyzer. Extract vendor details from bank email content, identify subscriptions, detect trials (amounts under ₹10 or keywords like 'trial', 'free', 'test'). Return only valid JSON.",
-                    "max_tokens": 400,
-                    "temperature": 0.2
-                }
-            }
-            
-            response = requests.post(url, headers=headers, json=data)
-            
-            if response.status_code == 201:
-                prediction = response.json()
-                prediction_id = prediction['id']
-                result = self.poll_prediction(prediction_id)
+            # Emails the reply didn't cover fall back to single-email prompts below
+            if batch_analyses:
+                with self.analysis_cache_lock:
+                    for index, analysis in zip(pending, batch_analyses):
+                        if analysis is None:
+                            continue
+                        analyses[index] = analysis
+                        self._cache_analysis(template_keys[index], analysis)
+        
+        return [
+            local_analyses[index] if index in local_analyses
+            else self.analyze_transaction_complete(subject, body, bank_name, analysis, template_keys[index])
+            for index, ((subject, body, bank_name), analysis) in enumerate(zip(emails, analyses))
+        ]
+    
+    def _local_analysis(self, subject: str, body: str, bank_name: str) -> Optional[Dict]:
+        """Keyword-only analysis when the email is unambiguous, None when the model should decide"""
+        body_clean = self.clean_html_content(body)
+        text = f"{subject} {body_clean}".lower()
+        
+        # Subscription services need the model's vendor and billing details
+        if any(indicator in text for indicator in self._SUBSCRIPTION_INDICATORS):
+            return None
+        
+        keyword_counts = self._count_category_keywords(text)
+        hits = [count for count in keyword_counts.values() if count]
+        if len(hits) != 1 or hits[0] < self._LOCAL_MIN_KEYWORDS:
+            return None
+        
+        # Hand over the cleaned body and keyword scan so the email isn't parsed or scanned twice
+        analysis = self.enhanced_fallback_analysis(subject, body, bank_name, body_clean, keyword_counts)
+        if not analysis['amount'] or analysis['merchant_name'] == "Unknown Vendor":
+            return None
+        return analysis
+    
+    def analyze_transaction_complete(self, subject: str, body: str, bank_name: str,
+                                     analysis: Optional[Dict] = None, template_key: Optional[bytes] = None) -> Dict:
+        """Complete AI analysis of transaction, optionally from a model analysis already obtained"""
+        try:
+            if analysis is None:
+                if template_key is None:
+                    template_key = self._template_key(subject, body)
+                with self.analysis_cache_lock:
+                    cached_analysis = self.analysis_cache.get(template_key)
+                    if cached_analysis is not None:
+                        self.analysis_cache.move_to_end(template_key)
                 
-                if result:
-                    try:
-                        json_match = re.search(r'\{.*\}', result.strip(), re.DOTALL)
-                        if json_match:
-                            json_str = json_match.group(0)
-                            analysis = json.loads(json_str)
-                        else:
-                            analysis = json.loads(result.strip())
-                        
-                        category = analysis.get('category', 'Other Transactions')
-                        vendor = analysis.get('vendor', 'Unknown Vendor')
-                        color = analysis.get('color', self.get_category_color(category))
-                        amount = analysis.get('amount')
-                        confidence = analysis.get('confidence', 50)
-                        is_subscription = analysis.get('is_subscription', False)
-                        subscription_type = analysis.get('subscription_type')
-                        billing_cycle = analysis.get('billing_cycle')
-                        service_logo = analysis.get('service_logo', '💳')
-                        is_trial = analysis.get('is_trial', False)
-                        
-                        # Validate amount
-                        if amount and isinstance(amount, str):
-                            amount = re.sub(r'[^\d.]', '', amount)
-                            try:
-                                amount = float(amount)
-                                if amount <= 0 or amount > 10000000:
-                                    amount = None
-                                # Check if amount indicates trial
-                                elif amount <= 10:
-                                    is_trial = True
-                            except:
-                                amount = None
-                        
-                        # Additional trial detection
-                        if not is_trial:
-                            trial_keywords = ['trial', 'free', 'test', 'demo', 'preview', 'beta']
-                            text_content = f"{subject} {body}".lower()
-                            is_trial = any(keyword in text_content for keyword in trial_keywords)
-                            if amount and amount <= 10:
-                                is_trial = True
-                        
-                        # Store color for category
-                        if category.lower() not in self.category_colors:
-                            self.category_colors[category.lower()] = color if color and color.startswith('#') else self.get_next_color()
-                        
-                        vendor_key = vendor.lower().strip()
-                        if vendor_key not in self.vendor_cache:
-                            self.vendor_cache[vendor_key] = {
-                                'display_name': vendor,
-                                'category': category,
-                                'color': self.category_colors[category.lower()],
-                                'is_subscription': is_subscription,
-                                'subscription_type': subscription_type,
-                                'service_logo': service_logo,
-                                'is_trial': is_trial
-                            }
-                        
-                        return {
-                            'amount': str(amount) if amount else None,
-                            'category': category,
-                            'merchant_name': vendor,
-                            'color': self.category_colors[category.lower()],
-                            'confidence': confidence,
-                            'is_subscription': is_subscription,
-                            'subscription_type': subscription_type,
-                            'billing_cycle': billing_cycle,
-                            'service_logo': service_logo,
-                            'is_trial': is_trial
-                        }
-                    except json.JSONDecodeError:
-                        pass
+                if cached_analysis is not None:
+                    # Same template as an earlier email: reuse its analysis, but take the amount from this email
+                    analysis = dict(cached_analysis, amount=self.extract_amount_regex(f"{subject} {body}"))
+                else:
+                    local_analysis = self._local_analysis(subject, body, bank_name)
+                    if local_analysis is not None:
+                        return local_analysis
+                    analysis = self._request_analysis(subject, body, bank_name)
+                    if not isinstance(analysis, dict):
+                        return self.enhanced_fallback_analysis(subject, body, bank_name)
+                    with self.analysis_cache_lock:
+                        self._cache_analysis(template_key, analysis)
+            
+            category = analysis.get('category', 'Other Transactions')
+            vendor = analysis.get('vendor', 'Unknown Vendor')
+            color = analysis.get('color', self.get_category_color(category))
+            amount = analysis.get('amount')
+            confidence = analysis.get('confidence', 50)
+            is_subscription = analysis.get('is_subscription', False)
+            subscription_type = analysis.get('subscription_type')
+            billing_cycle = analysis.get('billing_cycle')
+            service_logo = analysis.get('service_logo', '💳')
+            is_trial = analysis.get('is_trial', False)
+            
+            # Validate amount
+            if amount and isinstance(amount, str):
+                amount = self._NON_NUMERIC_RE.sub('', amount)
+                try:
+                    amount = float(amount)
+                    if amount <= 0 or amount > 10000000:
+                        amount = None
+                    # Check if amount indicates trial
+                    elif amount <= 10:
+                        is_trial = True
+                except:
+                    amount = None
+            
+            # Additional trial detection
+            if not is_trial:
+                text_content = f"{subject} {body}".lower()
+                is_trial = any(keyword in text_content for keyword in self._TRIAL_KEYWORDS)
+                if amount and amount <= 10:
+                    is_trial = True
+            
+            # Store color for category
+            if category.lower() not in self.category_colors:
+                self.category_colors[category.lower()] = color if color and color.startswith('#') else self.get_next_color()
+            
+            vendor_key = vendor.lower().strip()
+            if vendor_key not in self.vendor_cache:
+                self.vendor_cache[vendor_key] = {
+                    'display_name': vendor,
+                    'category': category,
+                    'color': self.category_colors[category.lower()],
+                    'is_subscription': is_subscription,
+                    'subscription_type': subscription_type,
+                    'service_logo': service_logo,
+                    'is_trial': is_trial
+                }
             
-            return self.enhanced_fallback_analysis(subject, body, bank_name)
+            return {
+                'amount': str(amount) if amount else None,
+                'category': category,
+                'merchant_name': vendor,
+                'color': self.category_colors[category.lower()],
+                'confidence': confidence,
+                'is_subscription': is_subscription,
+                'subscription_type': subscription_type,
+                'billing_cycle': billing_cycle,
+                'service_logo': service_logo,
+                'is_trial': is_trial
+            }
                 
         except Exception:
             return self.enhanced_fallback_analysis(subject, body, bank_name)
     
-    def enhanced_fallback_analysis(self, subject: str, body: str, bank_name: str) -> Dict:
+    def enhanced_fallback_analysis(self, subject: str, body: str, bank_name: str, body_clean: Optional[str] = None,
+                                   keyword_counts: Optional[Dict[str, int]] = None) -> Dict:
         """Enhanced fallback analysis with vendor extraction and trial detection"""
-        body_clean = self.clean_html_content(body)
+        if body_clean is None:
+            body_clean = self.clean_html_content(body)
         text = f"{subject} {body_clean}".lower()
         
         amount = self.extract_amount_regex(f"{subject} {body}")
@@ -620,32 +933,22 @@ Extract and return ONLY this JSON:
             pass
         
         # Enhanced vendor extraction patterns
-        vendor_patterns = [
-            r'(?:at|@)\s+([A-Za-z][A-Za-z0-9\s&.-]{2,30})(?:\s|$|,|\.|;)',
-            r'(?:paid to|payment to|transfer to)\s+([A-Za-z][A-Za-z0-9\s&.-]{2,30})(?:\s|$|,|\.|;)',
-            r'(?:merchant|store|shop):\s*([A-Za-z][A-Za-z0-9\s&.-]{2,30})(?:\s|$|,|\.|;)',
-            r'(?:purchase from|bought from)\s+([A-Za-z][A-Za-z0-9\s&.-]{2,30})(?:\s|$|,|\.|;)',
-            r'([A-Z][A-Z0-9\s&.-]{3,25})\s+(?:store|shop|restaurant|cafe)',
-            r'(?:^|\s)([A-Z][a-z]+(?:\s[A-Z][a-z]+)*)\s+(?:payment|transaction)',
-        ]
-        
         vendor = "Unknown Vendor"
-        for pattern in vendor_patterns:
-            matches = re.findall(pattern, body_clean, re.IGNORECASE | re.MULTILINE)
+        for pattern in self._VENDOR_PATTERNS:
+            matches = pattern.findall(body_clean)
             if matches:
                 vendor = matches[0].strip().title()
                 if len(vendor) > 3 and not vendor.lower() in ['the', 'and', 'for', 'with', 'from', 'account', 'bank', 'card']:
                     break
         
         # Check subscription indicators
-        is_subscription = any(indicator in text for indicator in self.subscription_indicators)
+        is_subscription = any(indicator in text for indicator in self._SUBSCRIPTION_INDICATORS)
         subscription_type = None
         billing_cycle = None
         service_logo = '💳'
         
         # Trial detection
-        trial_keywords = ['trial', 'free', 'test', 'demo', 'preview', 'beta', 'promo']
-        is_trial = any(keyword in text for keyword in trial_keywords)
+        is_trial = any(keyword in text for keyword in self._FALLBACK_TRIAL_KEYWORDS)
         if amount_float and amount_float <= 10:
             is_trial = True
         
@@ -678,29 +981,14 @@ Extract and return ONLY this JSON:
             else:
                 billing_cycle = 'monthly'
         
-        # Enhanced category mapping
-        category_mapping = {
-            'food delivery': {'keywords': ['zomato', 'swiggy', 'uber eats', 'foodpanda', 'delivery', 'dominos', 'pizza', 'kfc', 'mcdonalds'], 'color': '#FF6B35'},
-            'restaurants': {'keywords': ['restaurant', 'dining', 'cafe', 'coffee', 'starbucks', 'ccd', 'bistro'], 'color': '#F7931E'},
-            'grocery stores': {'keywords': ['grocery', 'supermarket', 'big bazaar', 'dmart', 'reliance fresh', 'more', 'store'], 'color': '#4CAF50'},
-            'ride sharing': {'keywords': ['uber', 'ola', 'taxi', 'cab', 'ride'], 'color': '#000000'},
-            'fuel & petrol': {'keywords': ['petrol', 'diesel', 'fuel', 'gas', 'hp', 'bharat petroleum', 'iocl'], 'color': '#FF4444'},
-            'online shopping': {'keywords': ['amazon', 'flipkart', 'myntra', 'jabong', 'snapdeal', 'online', 'ecommerce'], 'color': '#FF5722'},
-            'streaming services': {'keywords': ['netflix', 'prime video', 'hotstar', 'disney', 'youtube', 'spotify'], 'color': '#E50914'},
-            'saas services': {'keywords': ['google cloud', 'aws', 'azure', 'office 365', 'adobe', 'dropbox'], 'color': '#4285F4'},
-            'pharmacy': {'keywords': ['pharmacy', 'medical', 'medicine', 'drug', 'apollo', 'netmeds'], 'color': '#4CAF50'},
-            'atm withdrawal': {'keywords': ['atm', 'withdrawal', 'cash', 'withdraw'], 'color': '#795548'},
-            'money transfer': {'keywords': ['transfer', 'upi', 'neft', 'rtgs', 'imps', 'paytm', 'phonepe', 'gpay'], 'color': '#2196F3'},
-            'electricity bill': {'keywords': ['electricity', 'power', 'current bill', 'bescom', 'kseb'], 'color': '#FFC107'},
-            'internet & telecom': {'keywords': ['internet', 'broadband', 'wifi', 'airtel', 'jio', 'bsnl', 'mobile bill'], 'color': '#9C27B0'},
-        }
-        
         category = 'other transactions'
         color = self.get_next_color()
         max_matches = 0
         
-        for cat, info in category_mapping.items():
-            matches = sum(1 for keyword in info['keywords'] if keyword in text)
+        if keyword_counts is None:
+            keyword_counts = self._count_category_keywords(text)
+        for cat, info in _FALLBACK_CATEGORY_MAPPING.items():
+            matches = keyword_counts.get(cat, 0)
             if matches > max_matches:
                 max_matches = matches
                 category = cat
@@ -735,24 +1023,34 @@ Extract and return ONLY this JSON:
             'is_trial': is_trial
         }
     
+    def _count_category_keywords(self, text: str) -> Dict[str, int]:
+        """Count the distinct fallback keywords each category has in text"""
+        if _CATEGORY_AUTOMATON is None:
+            keywords = set()
+            for longest in {match.group(1) for match in _KEYWORD_SCAN_RE.finditer(text)}:
+                keywords.add(longest)
+                keywords.update(_KEYWORD_PREFIXES[longest])
+            found = ((keyword, _KEYWORD_CATEGORIES[keyword]) for keyword in keywords)
+        else:
+            # One pass over the text finds every keyword occurrence, overlapping ones included
+            found = {value for _, value in _CATEGORY_AUTOMATON.iter(text)}
+        
+        counts = {}
+        for keyword, categories in found:
+            for cat in categories:
+                counts[cat] = counts.get(cat, 0) + 1
+        return counts
+    
     def extract_amount_regex(self, text: str) -> Optional[str]:
         """Extract amount with enhanced patterns"""
-        patterns = [
-            r'(?:Rs\.?\s*|₹\s*)(\d+(?:,\d+)*(?:\.\d{1,2})?)',
-            r'(?:INR\s*)(\d+(?:,\d+)*(?:\.\d{1,2})?)',
-            r'(?:\$|USD\s*)(\d+(?:,\d+)*(?:\.\d{1,2})?)',
-            r'(?:Amount\s*:?\s*Rs\.?\s*|Amount\s*:?\s*₹\s*)(\d+(?:,\d+)*(?:\.\d{1,2})?)',
-            r'(?:Amount\s*:?\s*)(\d+(?:,\d+)*(?:\.\d{1,2})?)',
-            r'(?:Debited|Credited|Withdrawn).*?(?:Rs\.?\s*|₹\s*)(\d+(?:,\d+)*(?:\.\d{1,2})?)',
-            r'(?:Debited|Credited|Withdrawn).*?(\d+(?:,\d+)*(?:\.\d{1,2})?)',
-            r'(?:^|\s)(\d{1,8}\.\d{2})(?:\s|$)',
-            r'(?:^|\s)(\d{2,8})(?:\s|$)'
-        ]
+        # Every pattern needs a digit, so digit-free text can skip the scan entirely
+        if not _DIGIT_RE.search(text):
+            return None
         
-        for pattern in patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            for match in matches:
-                amount = match.replace(',', '').strip()
+        # Pattern by pattern, each over its own non-overlapping matches: the first in-range amount wins
+        for pattern in self._AMOUNT_PATTERNS:
+            for match in pattern.finditer(text):
+                amount = match.group(1).replace(',', '').strip()
                 try:
                     amount_float = float(amount)
                     if 0.01 <= amount_float <= 10000000:
@@ -762,31 +1060,33 @@ Extract and return ONLY this JSON:
         
         return None
     
-    def poll_prediction(self, prediction_id: str, max_attempts: int = 30) -> Optional[str]:
-        """Poll prediction with retry logic"""
-        import time
-        
+    def poll_prediction(self, prediction_id: str, timeout: float = 60.0) -> Optional[str]:
+        """Poll prediction until it finishes or the deadline passes"""
         url = f"https://api.replicate.com/v1/predictions/{prediction_id}"
-        headers = {
-            "Authorization": f"Bearer {self.replicate_token}"
-        }
+        deadline = time.monotonic() + timeout
+        attempt = 0
         
-        for attempt in range(max_attempts):
+        while time.monotonic() < deadline:
             try:
-                response = requests.get(url, headers=headers)
+                response = self.session.get(url)
                 
                 if response.status_code == 200:
-                    result = response.json()
+                    result = json_loads(response.content)
                     
                     if result['status'] == 'succeeded':
                         output = result.get('output', [])
                         if output:
                             return ''.join(output).strip()
                         return None
-                    elif result['status'] == 'failed':
+                    elif result['status'] in ('failed', 'canceled'):
                         return None
                     else:
-                        time.sleep(2)
+                        # Exponential backoff by status with jitter: 'starting' begins at 50ms and
+                        # 'processing' at 200ms, and concurrent workers don't poll Replicate in lockstep
+                        base_delay = 0.05 if result['status'] == 'starting' else 0.2
+                        delay = min(3.0, base_delay * (1.5 ** attempt)) + random.uniform(0, 0.1)
+                        attempt += 1
+                        time.sleep(max(0.0, min(delay, deadline - time.monotonic())))
                         continue
                 else:
                     return None
@@ -805,17 +1105,64 @@ Extract and return ONLY this JSON:
             color = self.get_next_color()
             self.category_colors[category_lower] = color
             return color
+    
+    def color_map_for(self, categories) -> Dict[str, str]:
+        """Chart color map for just the given categories (colors are stored under lowercased names)"""
+        category_colors = self.category_colors
+        return {
+            category: category_colors[category.lower()]
+            for category in categories
+            if category.lower() in category_colors
+        }
 
 class SubscriptionTracker:
     """Subscription tracking with trial detection and optimized unique ID generation"""
     
+    # Known services as (substring, details) pairs, scanned in order so 'google cloud' wins over 'google';
+    # built once per class instead of on every detection call
+    _SERVICE_PATTERNS = (
+        ('netflix', {'name': 'Netflix', 'category': 'Video Streaming', 'logo': '🎬', 'color': '#E50914', 'confidence': 85}),
+        ('spotify', {'name': 'Spotify', 'category': 'Music Streaming', 'logo': '🎧', 'color': '#1DB954', 'confidence': 85}),
+        ('youtube', {'name': 'YouTube Premium', 'category': 'Video Streaming', 'logo': '▶️', 'color': '#FF0000', 'confidence': 80}),
+        ('amazon', {'name': 'Amazon Prime', 'category': 'Video Streaming', 'logo': '📦', 'color': '#FF9900', 'confidence': 85}),
+        ('microsoft', {'name': 'Microsoft 365', 'category': 'Productivity SaaS', 'logo': '💼', 'color': '#0078D4', 'confidence': 80}),
+        ('adobe', {'name': 'Adobe Creative', 'category': 'Design SaaS', 'logo': '🎨', 'color': '#FF0000', 'confidence': 80}),
+        ('google cloud', {'name': 'Google Cloud', 'category': 'Cloud Platform', 'logo': '☁️', 'color': '#4285F4', 'confidence': 90}),
+        ('google', {'name': 'Google Workspace', 'category': 'Productivity SaaS', 'logo': '☁️', 'color': '#4285F4', 'confidence': 75}),
+    )
+    
+    # Service details for manually added subscriptions, same ordered layout
+    _MANUAL_SERVICE_PATTERNS = (
+        ('netflix', {'category': 'Video Streaming', 'logo': '🎬', 'color': '#E50914'}),
+        ('amazon prime', {'category': 'Video Streaming', 'logo': '📺', 'color': '#FF9900'}),
+        ('disney', {'category': 'Video Streaming', 'logo': '🏰', 'color': '#113CCF'}),
+        ('youtube', {'category': 'Video Streaming', 'logo': '▶️', 'color': '#FF0000'}),
+        ('spotify', {'category': 'Music Streaming', 'logo': '🎧', 'color': '#1DB954'}),
+        ('apple music', {'category': 'Music Streaming', 'logo': '🎵', 'color': '#FA243C'}),
+        ('hotstar', {'category': 'Video Streaming', 'logo': '🌟', 'color': '#0F1419'}),
+        ('microsoft', {'category': 'Productivity SaaS', 'logo': '💼', 'color': '#0078D4'}),
+        ('adobe', {'category': 'Design SaaS', 'logo': '🎨', 'color': '#FF0000'}),
+        ('google cloud', {'category': 'Cloud Platform', 'logo': '☁️', 'color': '#4285F4'}),
+        ('google', {'category': 'Productivity SaaS', 'logo': '☁️', 'color': '#4285F4'}),
+        ('dropbox', {'category': 'Cloud Storage', 'logo': '📦', 'color': '#0061FF'}),
+        ('zoom', {'category': 'Video Conferencing', 'logo': '📹', 'color': '#2D8CFF'}),
+        ('slack', {'category': 'Team Communication', 'logo': '💬', 'color': '#4A154B'}),
+        ('notion', {'category': 'Productivity SaaS', 'logo': '📝', 'color': '#000000'}),
+        ('zomato', {'category': 'Food Delivery', 'logo': '🍕', 'color': '#E23744'}),
+        ('swiggy', {'category': 'Food Delivery', 'logo': '🛵', 'color': '#FC8019'}),
+        ('uber eats', {'category': 'Food Delivery', 'logo': '🍔', 'color': '#000000'}),
+        ('airtel', {'category': 'Telecom', 'logo': '📶', 'color': '#E50000'}),
+        ('jio', {'category': 'Telecom', 'logo': '📱', 'color': '#0066CC'}),
+        ('vi', {'category': 'Telecom', 'logo': '📞', 'color': '#FF6B00'}),
+    )
+    
     def __init__(self, config_manager: ConfigManager):
         self.config_manager = config_manager
     
     def generate_unique_id(self, prefix: str, merchant_name: str, amount: float, extra: str = "") -> str:
         """Generate a truly unique ID using hash of multiple components"""
         timestamp = str(int(time.time() * 1000))
-        merchant_clean = re.sub(r'[^a-zA-Z0-9]', '', merchant_name.lower())
+        merchant_clean = _NON_ALNUM_RE.sub('', merchant_name.lower())
         amount_str = str(int(amount * 100)) if amount else "0"
         
         # Create hash from components
@@ -867,14 +1214,15 @@ class SubscriptionTracker:
         
         detected_subscriptions = []
         
-        subscription_transactions = df[df.get('is_subscription', False) == True].copy()
+        subscription_transactions = df[df.get('is_subscription', False) == True]
         
         if subscription_transactions.empty:
             return self._detect_subscriptions_by_pattern(df)
         
-        subscription_transactions['merchant_key'] = subscription_transactions['merchant_name'].str.lower().str.strip()
+        # Grouping by a derived key Series avoids copying the slice just to add a column
+        merchant_key = subscription_transactions['merchant_name'].str.lower().str.strip().rename('merchant_key')
         
-        merchant_groups = subscription_transactions.groupby(['merchant_key', 'amount_numeric']).agg({
+        merchant_groups = subscription_transactions.groupby([merchant_key, 'amount_numeric']).agg({
             'date_parsed': ['count', 'min', 'max'],
             'merchant_name': 'first',
             'category': 'first',
@@ -958,9 +1306,9 @@ class SubscriptionTracker:
         """Fallback pattern-based subscription detection with trial detection"""
         detected_subscriptions = []
         
-        df['merchant_key'] = df['subject'].str.lower().str.strip()
+        merchant_key = df['subject'].str.lower().str.strip().rename('merchant_key')
         
-        merchant_groups = df.groupby(['merchant_key', 'amount_numeric']).agg({
+        merchant_groups = df.groupby([merchant_key, 'amount_numeric']).agg({
             'date_parsed': ['count', 'min', 'max'],
             'subject': 'first',
             'category': 'first',
@@ -973,60 +1321,57 @@ class SubscriptionTracker:
         
         potential_subs = merchant_groups[merchant_groups['transaction_count'] >= 2]
         
-        for idx, row in potential_subs.iterrows():
-            date_diff = (row['last_date'] - row['first_date']).days
+        # Classify every group's billing cycle at once, then only walk the regular ones
+        date_diff = (potential_subs['last_date'] - potential_subs['first_date']).dt.days
+        avg_cycle = date_diff / (potential_subs['transaction_count'] - 1)
+        billing_cycles = pd.Series(np.select(
+            [avg_cycle.between(25, 35), avg_cycle.between(85, 95), avg_cycle.between(360, 370)],
+            ['Monthly', 'Quarterly', 'Yearly'],
+            default='Irregular'
+        ), index=potential_subs.index)
+        regular = (date_diff > 0) & (billing_cycles != 'Irregular')
+        
+        for idx, row in potential_subs[regular].iterrows():
             amount = float(row['amount_numeric'])
+            billing_cycle = billing_cycles[idx]
             
-            if date_diff > 0:
-                avg_cycle = date_diff / (row['transaction_count'] - 1)
-                
-                if 25 <= avg_cycle <= 35:
-                    billing_cycle = 'Monthly'
-                elif 85 <= avg_cycle <= 95:
-                    billing_cycle = 'Quarterly'
-                elif 360 <= avg_cycle <= 370:
-                    billing_cycle = 'Yearly'
-                else:
-                    billing_cycle = 'Irregular'
-                
-                if billing_cycle in ['Monthly', 'Quarterly', 'Yearly']:
-                    service_info = self._basic_service_detection(row['subject'], amount)
-                    
-                    # Trial detection for pattern-based subscriptions
-                    trial_info = self.detect_subscription_type_and_trial(
-                        service_info['name'], 
-                        amount, 
-                        {'original_description': row['subject']}
-                    )
-                    
-                    # Generate unique ID
-                    unique_id = self.generate_unique_id(
-                        "pattern", 
-                        service_info['name'], 
-                        amount, 
-                        f"{idx}_{billing_cycle}"
-                    )
-                    
-                    detected_subscriptions.append({
-                        'id': unique_id,
-                        'service_name': service_info['name'],
-                        'service_logo': service_info['logo'],
-                        'amount': amount,
-                        'billing_cycle': billing_cycle,
-                        'start_date': row['first_date'].date(),
-                        'last_payment': row['last_date'].date(),
-                        'category': service_info['category'],
-                        'brand_color': service_info['color'],
-                        'bank': row['bank'],
-                        'transaction_count': row['transaction_count'],
-                        'status': 'Trial' if trial_info['is_trial'] else 'Active',
-                        'auto_detected': True,
-                        'original_description': row['subject'],
-                        'confidence_score': service_info['confidence'],
-                        'subscription_type': 'pattern_detected',
-                        'is_trial': trial_info['is_trial'],
-                        'trial_reason': trial_info['trial_reason']
-                    })
+            service_info = self._basic_service_detection(row['subject'], amount)
+            
+            # Trial detection for pattern-based subscriptions
+            trial_info = self.detect_subscription_type_and_trial(
+                service_info['name'], 
+                amount, 
+                {'original_description': row['subject']}
+            )
+            
+            # Generate unique ID
+            unique_id = self.generate_unique_id(
+                "pattern", 
+                service_info['name'], 
+                amount, 
+                f"{idx}_{billing_cycle}"
+            )
+            
+            detected_subscriptions.append({
+                'id': unique_id,
+                'service_name': service_info['name'],
+                'service_logo': service_info['logo'],
+                'amount': amount,
+                'billing_cycle': billing_cycle,
+                'start_date': row['first_date'].date(),
+                'last_payment': row['last_date'].date(),
+                'category': service_info['category'],
+                'brand_color': service_info['color'],
+                'bank': row['bank'],
+                'transaction_count': row['transaction_count'],
+                'status': 'Trial' if trial_info['is_trial'] else 'Active',
+                'auto_detected': True,
+                'original_description': row['subject'],
+                'confidence_score': service_info['confidence'],
+                'subscription_type': 'pattern_detected',
+                'is_trial': trial_info['is_trial'],
+                'trial_reason': trial_info['trial_reason']
+            })
         
         return detected_subscriptions
     
@@ -1034,20 +1379,9 @@ class SubscriptionTracker:
         """Basic service detection for fallback with enhanced Google Cloud detection"""
         desc_lower = description.lower().strip()
         
-        service_patterns = {
-            'netflix': {'name': 'Netflix', 'category': 'Video Streaming', 'logo': '🎬', 'color': '#E50914', 'confidence': 85},
-            'spotify': {'name': 'Spotify', 'category': 'Music Streaming', 'logo': '🎧', 'color': '#1DB954', 'confidence': 85},
-            'youtube': {'name': 'YouTube Premium', 'category': 'Video Streaming', 'logo': '▶️', 'color': '#FF0000', 'confidence': 80},
-            'amazon': {'name': 'Amazon Prime', 'category': 'Video Streaming', 'logo': '📦', 'color': '#FF9900', 'confidence': 85},
-            'microsoft': {'name': 'Microsoft 365', 'category': 'Productivity SaaS', 'logo': '💼', 'color': '#0078D4', 'confidence': 80},
-            'adobe': {'name': 'Adobe Creative', 'category': 'Design SaaS', 'logo': '🎨', 'color': '#FF0000', 'confidence': 80},
-            'google cloud': {'name': 'Google Cloud', 'category': 'Cloud Platform', 'logo': '☁️', 'color': '#4285F4', 'confidence': 90},
-            'google': {'name': 'Google Workspace', 'category': 'Productivity SaaS', 'logo': '☁️', 'color': '#4285F4', 'confidence': 75},
-        }
-        
-        for pattern, info in service_patterns.items():
+        for pattern, info in self._SERVICE_PATTERNS:
             if pattern in desc_lower:
-                return info
+                return dict(info)
         
         # Special handling for cloud services
         if any(keyword in desc_lower for keyword in ['cloud', 'aws', 'azure', 'gcp']):
@@ -1140,7 +1474,8 @@ class SubscriptionTracker:
         """Calculate next payment date"""
         last_payment = subscription.get('last_payment', subscription['start_date'])
         if isinstance(last_payment, str):
-            last_payment = datetime.strptime(last_payment, '%Y-%m-%d').date()
+            # Stored dates are always YYYY-MM-DD, which fromisoformat parses without strptime's format machinery
+            last_payment = date.fromisoformat(last_payment)
         
         billing_cycle = subscription['billing_cycle']
         
@@ -1192,33 +1527,9 @@ class SubscriptionTracker:
         """Enhanced service detection for manually added subscriptions"""
         service_lower = service_name.lower().strip()
         
-        enhanced_patterns = {
-            'netflix': {'category': 'Video Streaming', 'logo': '🎬', 'color': '#E50914'},
-            'amazon prime': {'category': 'Video Streaming', 'logo': '📺', 'color': '#FF9900'},
-            'disney': {'category': 'Video Streaming', 'logo': '🏰', 'color': '#113CCF'},
-            'youtube': {'category': 'Video Streaming', 'logo': '▶️', 'color': '#FF0000'},
-            'spotify': {'category': 'Music Streaming', 'logo': '🎧', 'color': '#1DB954'},
-            'apple music': {'category': 'Music Streaming', 'logo': '🎵', 'color': '#FA243C'},
-            'hotstar': {'category': 'Video Streaming', 'logo': '🌟', 'color': '#0F1419'},
-            'microsoft': {'category': 'Productivity SaaS', 'logo': '💼', 'color': '#0078D4'},
-            'adobe': {'category': 'Design SaaS', 'logo': '🎨', 'color': '#FF0000'},
-            'google cloud': {'category': 'Cloud Platform', 'logo': '☁️', 'color': '#4285F4'},
-            'google': {'category': 'Productivity SaaS', 'logo': '☁️', 'color': '#4285F4'},
-            'dropbox': {'category': 'Cloud Storage', 'logo': '📦', 'color': '#0061FF'},
-            'zoom': {'category': 'Video Conferencing', 'logo': '📹', 'color': '#2D8CFF'},
-            'slack': {'category': 'Team Communication', 'logo': '💬', 'color': '#4A154B'},
-            'notion': {'category': 'Productivity SaaS', 'logo': '📝', 'color': '#000000'},
-            'zomato': {'category': 'Food Delivery', 'logo': '🍕', 'color': '#E23744'},
-            'swiggy': {'category': 'Food Delivery', 'logo': '🛵', 'color': '#FC8019'},
-            'uber eats': {'category': 'Food Delivery', 'logo': '🍔', 'color': '#000000'},
-            'airtel': {'category': 'Telecom', 'logo': '📶', 'color': '#E50000'},
-            'jio': {'category': 'Telecom', 'logo': '📱', 'color': '#0066CC'},
-            'vi': {'category': 'Telecom', 'logo': '📞', 'color': '#FF6B00'},
-        }
-        
-        for pattern, info in enhanced_patterns.items():
+        for pattern, info in self._MANUAL_SERVICE_PATTERNS:
             if pattern in service_lower:
-                return info
+                return dict(info)
         
         # Infer category from keywords
         if any(word in service_lower for word in ['stream', 'video', 'movie', 'tv', 'watch']):
@@ -1280,38 +1591,80 @@ class SubscriptionTracker:
 
 class BankEmailExtractor:
     """Enhanced email extraction with multi-threaded processing"""
+    
+    # Fetch only the headers the parser reads (plus the MIME headers needed to decode
+    # the body) instead of the full RFC822 message; PEEK also leaves emails unread.
+    # The body is capped: alerts fit well within it and attachments are never downloaded whole
+    _HEADER_FIELDS = ('SUBJECT', 'FROM', 'DATE', 'MIME-VERSION', 'CONTENT-TYPE', 'CONTENT-TRANSFER-ENCODING')
+    _BODY_FETCH_BYTES = 65536
+    _FETCH_QUERY = f"(BODY.PEEK[HEADER.FIELDS ({' '.join(_HEADER_FIELDS)})] BODY.PEEK[TEXT]<0.{_BODY_FETCH_BYTES}>)"
+    _FETCH_SEQ_RE = re.compile(rb'^(\d+) \(')
+    _FETCH_UID_RE = re.compile(rb'UID (\d+)')
+    
+    # Messages requested per FETCH command; one round-trip serves the whole batch
+    _FETCH_BATCH_SIZE = 50
+    
+    # Emails analysed together in a single Replicate prediction
+    _PROMPT_BATCH_SIZE = 10
+    
+    # Prediction groups in flight at once; kept under the categorizer's HTTP pool size
+    _ANALYSIS_WORKERS = 15
+    
+    # Attempts per FETCH batch when Gmail throttles or drops the connection
+    _FETCH_ATTEMPTS = 3
+    
+    # IMAP sessions fetching batches side by side (Gmail allows 15 per account)
+    _FETCH_CONNECTIONS = 4
+    
+    # A session used this recently is trusted without a NOOP round-trip
+    _CONNECTION_FRESH_SECONDS = 60
+    
+    # Idle time after which the server has likely dropped the session (RFC 3501 allows 30 minutes),
+    # so a new one is opened straight away instead of waiting on a NOOP to fail
+    _CONNECTION_IDLE_LIMIT_SECONDS = 25 * 60
+    
+    # Alert sender addresses per bank
+    _BANK_SENDERS = {
+        'SBI': ['donotreply.sbiatm@alerts.sbi.co.in', 'alerts@sbi.co.in', 'sbicard.alerts@sbi.co.in'],
+        'HDFC Bank': ['alerts@hdfcbank.net', 'hdfcbank@hdfcbank.net'],
+        'ICICI Bank': ['alert@icicibank.com', 'credit_cards@icicibank.com'],
+        'Axis Bank': ['alerts@axisbank.com'],
+        'Kotak Mahindra Bank': ['creditcardalerts@kotak.com'],
+        'IDFC FIRST Bank': ['noreply@idfcfirstbank.com'],
+        'Yes Bank': ['alerts@yesbank.in'],
+        'IndusInd Bank': ['transactionalert@indusind.com'],
+        'Chase': ['noreply@chase.com'],
+        'Bank of America': ['alerts@bankofamerica.com'],
+        'Citi Bank': ['alerts@citibank.com'],
+        'Wells Fargo': ['alerts@wellsfargo.com'],
+        'Capital One': ['notifications@capitalone.com'],
+        'American Express': ['DoNotReply@americanexpress.com'],
+        'Discover': ['donotreply@discover.com'],
+        'Synchrony Bank': ['alerts@synchronybank.com'],
+        'US Bank': ['customerservice@usbank.com'],
+        'PNC Bank': ['alerts@pnc.com'],
+        'Truist': ['no-reply@truist.com'],
+        'Ally Bank': ['no-reply@ally.com'],
+        'SoFi': ['support@sofi.com'],
+        'PayPal': ['no-reply@paypal.com'],
+        'Venmo': ['donotreply@venmo.com'],
+        'TD Bank': ['mailer@tdbank.com', 'alerts@td.com'],
+        'Charles Schwab': ['no-reply@schwab.com']
+    }
+    
     def __init__(self, config_manager: ConfigManager):
         self.config_manager = config_manager
-        self.bank_senders = {
-            'SBI': ['donotreply.sbiatm@alerts.sbi.co.in', 'alerts@sbi.co.in', 'sbicard.alerts@sbi.co.in'],
-            'HDFC Bank': ['alerts@hdfcbank.net', 'hdfcbank@hdfcbank.net'],
-            'ICICI Bank': ['alert@icicibank.com', 'credit_cards@icicibank.com'],
-            'Axis Bank': ['alerts@axisbank.com'],
-            'Kotak Mahindra Bank': ['creditcardalerts@kotak.com'],
-            'IDFC FIRST Bank': ['noreply@idfcfirstbank.com'],
-            'Yes Bank': ['alerts@yesbank.in'],
-            'IndusInd Bank': ['transactionalert@indusind.com'],
-            'Chase': ['noreply@chase.com'],
-            'Bank of America': ['alerts@bankofamerica.com'],
-            'Citi Bank': ['alerts@citibank.com'],
-            'Wells Fargo': ['alerts@wellsfargo.com'],
-            'Capital One': ['notifications@capitalone.com'],
-            'American Express': ['DoNotReply@americanexpress.com'],
-            'Discover': ['donotreply@discover.com'],
-            'Synchrony Bank': ['alerts@synchronybank.com'],
-            'US Bank': ['customerservice@usbank.com'],
-            'PNC Bank': ['alerts@pnc.com'],
-            'Truist': ['no-reply@truist.com'],
-            'Ally Bank': ['no-reply@ally.com'],
-            'SoFi': ['support@sofi.com'],
-            'PayPal': ['no-reply@paypal.com'],
-            'Venmo': ['donotreply@venmo.com'],
-            'TD Bank': ['mailer@tdbank.com', 'alerts@td.com'],
-            'Charles Schwab': ['no-reply@schwab.com']
-        }
         self.mail = None
         self.lock = threading.Lock()
         
+        # Login kept in memory only, so a dropped IMAP session can be reopened without asking again
+        self._credentials = None
+        self._last_used = 0.0
+        
+        # Analysed emails keyed by IMAP UID, kept in memory for the session so repeat
+        # analyses only fetch and categorize messages that haven't been seen yet
+        self.processed_emails = {}
+        
         replicate_token = config_manager.get_config_value('REPLICATE_API_TOKEN')
         if replicate_token:
             self.categorizer = AITransactionCategorizer(replicate_token)
@@ -1321,8 +1674,10 @@ class BankEmailExtractor:
     def authenticate_gmail(self, email_address: str, password: str):
         """Authenticate with Gmail using IMAP"""
         try:
-            self.mail = imaplib.IMAP4_SSL('imap.gmail.com')
+            self.mail = imaplib.IMAP4_SSL('imap.gmail.com', ssl_context=_IMAP_SSL_CONTEXT)
             self.mail.login(email_address, password)
+            self._credentials = (email_address, password)
+            self._last_used = time.monotonic()
             return True, email_address
             
         except imaplib.IMAP4.error as e:
@@ -1338,15 +1693,72 @@ class BankEmailExtractor:
             st.error(f"❌ Connection failed: {e}")
             return False, None
     
-    def search_bank_emails(self, max_results: int = 50) -> List[str]:
-        """Search for bank emails"""
+    def ensure_connection(self, force: bool = False) -> bool:
+        """Reuse the logged-in IMAP session across analyses, reconnecting if it has dropped (or always, with force)"""
+        if self.mail is not None:
+            idle_seconds = time.monotonic() - self._last_used
+            if not force and idle_seconds < self._CONNECTION_FRESH_SECONDS:
+                return True
+            if not force and idle_seconds < self._CONNECTION_IDLE_LIMIT_SECONDS:
+                try:
+                    if self.mail.noop()[0] == 'OK':
+                        self._last_used = time.monotonic()
+                        return True
+                except Exception:
+                    pass
+            
+            # Close the old socket locally; a LOGOUT round-trip on a dead session would only stall
+            try:
+                self.mail.shutdown()
+            except Exception:
+                pass
+        
+        self.mail = self._open_connection()
+        if self.mail is None:
+            return False
+        self._last_used = time.monotonic()
+        return True
+    
+    def _open_connection(self):
+        """Open a new logged-in IMAP session on INBOX from the in-memory login"""
+        if not self._credentials:
+            return None
+        
+        try:
+            mail = imaplib.IMAP4_SSL('imap.gmail.com', ssl_context=_IMAP_SSL_CONTEXT)
+            mail.login(*self._credentials)
+            mail.select('INBOX')
+            return mail
+        except Exception:
+            return None
+    
+    def logout(self):
+        """Close the IMAP session and forget the in-memory login"""
+        if self.mail:
+            try:
+                self.mail.logout()
+            except Exception:
+                pass
+        self.mail = None
+        self._credentials = None
+    
+    def search_bank_emails(self, max_results: int = 50, start_date: Optional[date] = None,
+                           end_date: Optional[date] = None) -> List[str]:
+        """Search for bank emails, restricted server-side to the date range when one is given"""
         try:
             self.mail.select('INBOX')
+            self._last_used = time.monotonic()
             
-            all_message_ids = []
+            # A set, so the early stop below counts distinct emails rather than repeat hits
+            all_message_ids = set()
+            
+            # IMAP BEFORE is exclusive, so the end date is pushed one day forward
+            date_criteria = ''
+            if start_date and end_date:
+                date_criteria = f"SINCE {start_date:%d-%b-%Y} BEFORE {end_date + timedelta(days=1):%d-%b-%Y} "
             
             search_terms = [
-                *[f'FROM "{sender}"' for bank_senders in self.bank_senders.values() for sender in bank_senders],
+                *[f'FROM "{sender}"' for bank_senders in self._BANK_SENDERS.values() for sender in bank_senders],
                 'SUBJECT "transaction"',
                 'SUBJECT "debit"',
                 'SUBJECT "credit"',
@@ -1358,142 +1770,324 @@ class BankEmailExtractor:
                 'BODY "google cloud"'
             ]
             
-            for search_term in search_terms:
+            # One SEARCH with every term OR-ed together replaces a round-trip per term
+            combined_ok = False
+            try:
+                result, message_ids = self.mail.uid('search', None, date_criteria + self._or_criteria(search_terms))
+                if result == 'OK':
+                    combined_ok = True
+                    if message_ids[0]:
+                        all_message_ids.update(message_ids[0].split())
+            except imaplib.IMAP4.abort:
+                raise
+            except imaplib.IMAP4.error:
+                pass
+            
+            # Servers that reject the combined query are searched one term at a time
+            for search_term in ([] if combined_ok else search_terms):
                 if len(all_message_ids) >= max_results:
                     break
                     
                 try:
-                    result, message_ids = self.mail.search(None, search_term)
+                    result, message_ids = self.mail.uid('search', None, date_criteria + search_term)
                     
                     if result == 'OK' and message_ids[0]:
                         new_ids = message_ids[0].split()
-                        all_message_ids.extend(new_ids)
+                        all_message_ids.update(new_ids)
                         
                 except Exception as e:
                     continue
             
-            unique_ids = list(set(all_message_ids))
-            unique_ids.sort(reverse=True)
+            unique_ids = sorted(all_message_ids, key=int, reverse=True)
             
             return unique_ids[:max_results]
             
         except Exception as e:
-            st.error(f"Error searching emails: {e}")
-            return []
-    
-    def fetch_and_analyze_email(self, message_id: str) -> Optional[Dict]:
-        """Thread-safe method to fetch and analyze a single email"""
+            # Searches run on the analysis worker thread, where st.error can't reach the page;
+            # the caller reports the failure instead
+            raise RuntimeError(f"Error searching emails: {e}") from e
+    
+    @classmethod
+    def _or_criteria(cls, terms: List[str]) -> str:
+        """Combine IMAP search keys with nested ORs, split in halves so the nesting stays shallow"""
+        if len(terms) == 1:
+            return terms[0]
+        middle = len(terms) // 2
+        return f"OR ({cls._or_criteria(terms[:middle])}) ({cls._or_criteria(terms[middle:])})"
+    
+    def fetch_email_batch(self, message_ids: List[bytes], mail=None, reconnect=None) -> Dict[bytes, bytes]:
+        """Fetch several emails by UID in one IMAP FETCH, on mail (replaced by reconnect() if it drops) or the shared session"""
+        sections = {}
+        
         try:
-            with self.lock:
-                result, msg_data = self.mail.fetch(message_id, '(RFC822)')
+            result, msg_data = None, None
+            for attempt in range(self._FETCH_ATTEMPTS):
+                try:
+                    if mail is None:
+                        with self.lock:
+                            result, msg_data = self.mail.uid('fetch', b','.join(message_ids), self._FETCH_QUERY)
+                    else:
+                        result, msg_data = mail.uid('fetch', b','.join(message_ids), self._FETCH_QUERY)
+                    if result == 'OK':
+                        break
+                except imaplib.IMAP4.abort:
+                    # Connection dropped mid-batch: close it and retry the whole batch on a fresh session.
+                    # The shared session was just used, so its freshness shortcut has to be bypassed
+                    if mail is not None:
+                        try:
+                            mail.shutdown()
+                        except Exception:
+                            pass
+                        mail = reconnect() if reconnect is not None else None
+                    else:
+                        with self.lock:
+                            if not self.ensure_connection(force=True):
+                                return {}
+                
+                # NO responses are Gmail throttling; back off with jitter before retrying
+                if attempt < self._FETCH_ATTEMPTS - 1:
+                    time.sleep(0.5 * (2 ** attempt) + random.uniform(0, 0.25))
             
             if result != 'OK' or not msg_data:
+                return {}
+            
+            # Each message's sections follow a descriptor that starts with its sequence
+            # number and carries the UID the message is keyed by
+            current_id = None
+            for item in msg_data:
+                if not isinstance(item, tuple):
+                    continue
+                if self._FETCH_SEQ_RE.match(item[0]):
+                    uid_match = self._FETCH_UID_RE.search(item[0])
+                    current_id = uid_match.group(1) if uid_match else None
+                if current_id is not None:
+                    sections.setdefault(current_id, []).append(item)
+                    
+        except Exception:
+            return {}
+        
+        return {message_id: self._assemble_message(parts) for message_id, parts in sections.items()}
+    
+    def parse_email(self, raw_email: bytes) -> Optional[Dict]:
+        """Parse the fields the analysis needs out of a fetched email"""
+        try:
+            if not raw_email:
                 return None
-                
-            raw_email = msg_data[0][1]
             email_message = email.message_from_bytes(raw_email)
             
             subject = email_message.get('Subject', '')
             sender = email_message.get('From', '')
             date_header = email_message.get('Date', '')
             
-            body = self.extract_email_body(email_message)
-            bank_name = self.identify_bank(sender)
-            
-            if self.categorizer:
-                analysis = self.categorizer.analyze_transaction_complete(
-                    subject, 
-                    body, 
-                    bank_name
-                )
-                
-                amount = analysis['amount']
-                category = analysis['category']
-                merchant_name = analysis['merchant_name']
-                category_color = analysis['color']
-                confidence = analysis['confidence']
-                is_subscription = analysis.get('is_subscription', False)
-                subscription_type = analysis.get('subscription_type')
-                billing_cycle = analysis.get('billing_cycle')
-                service_logo = analysis.get('service_logo', '💳')
-                is_trial = analysis.get('is_trial', False)
-            else:
-                amount = None
-                category = 'Other'
-                merchant_name = subject[:50]
-                category_color = '#6C757D'
-                confidence = 0
-                is_subscription = False
-                subscription_type = None
-                billing_cycle = None
-                service_logo = '💳'
-                is_trial = False
+            # Parse the Date header once here so the dataframes convert a uniform ISO column;
+            # the sender's wall-clock time is kept, matching how the raw header was read before
+            try:
+                date_iso = email.utils.parsedate_to_datetime(date_header).replace(tzinfo=None).isoformat(timespec='seconds')
+            except (TypeError, ValueError):
+                date_iso = None
             
             return {
-                'message_id': message_id.decode() if isinstance(message_id, bytes) else str(message_id),
-                'date': date_header,
-                'bank': bank_name,
                 'subject': subject,
-                'merchant_name': merchant_name,
                 'sender': sender,
-                'amount': amount,
-                'category': category,
-                'category_color': category_color,
-                'color': category_color,
-                'confidence': confidence,
-                'is_subscription': is_subscription,
-                'subscription_type': subscription_type,
-                'billing_cycle': billing_cycle,
-                'service_logo': service_logo,
-                'is_trial': is_trial,
-                'email_body_preview': body[:200] + "..." if len(body) > 200 else body
+                'date': date_header,
+                'date_iso': date_iso,
+                'body': self.extract_email_body(email_message),
+                'bank': self.identify_bank(sender)
             }
             
         except Exception:
             return None
     
-    def process_emails(self, max_emails: int = 50, progress_callback=None) -> List[Dict]:
-        """Process emails with multi-threaded processing"""
+    def analyze_email_batch(self, fetched_emails: List[tuple]) -> List[tuple]:
+        """Thread-safe method to parse and analyze a group of fetched emails with one AI prediction"""
+        parsed_emails = []
+        for message_id, raw_email in fetched_emails:
+            fields = self.parse_email(raw_email)
+            if fields:
+                parsed_emails.append((message_id, fields))
+        
+        if not parsed_emails:
+            return []
+        
+        if self.categorizer:
+            try:
+                analyses = self.categorizer.analyze_transactions_batch(
+                    [(fields['subject'], fields['body'], fields['bank']) for _, fields in parsed_emails]
+                )
+            except Exception:
+                return []
+        else:
+            analyses = [None] * len(parsed_emails)
+        
+        return [
+            (message_id, self._build_record(message_id, fields, analysis))
+            for (message_id, fields), analysis in zip(parsed_emails, analyses)
+        ]
+    
+    def _build_record(self, message_id, fields: Dict, analysis: Optional[Dict]) -> Dict:
+        """Combine an email's parsed fields with its analysis into a transaction record"""
+        subject = fields['subject']
+        body = fields['body']
+        
+        if analysis:
+            amount = analysis['amount']
+            category = analysis['category']
+            merchant_name = analysis['merchant_name']
+            category_color = analysis['color']
+            confidence = analysis['confidence']
+            is_subscription = analysis.get('is_subscription', False)
+            subscription_type = analysis.get('subscription_type')
+            billing_cycle = analysis.get('billing_cycle')
+            service_logo = analysis.get('service_logo', '💳')
+            is_trial = analysis.get('is_trial', False)
+        else:
+            amount = None
+            category = 'Other'
+            merchant_name = subject[:50]
+            category_color = '#6C757D'
+            confidence = 0
+            is_subscription = False
+            subscription_type = None
+            billing_cycle = None
+            service_logo = '💳'
+            is_trial = False
+        
+        return {
+            'message_id': message_id.decode() if isinstance(message_id, bytes) else str(message_id),
+            'date': fields['date'],
+            'date_iso': fields['date_iso'],
+            'bank': fields['bank'],
+            'subject': subject,
+            'merchant_name': merchant_name,
+            'sender': fields['sender'],
+            'amount': amount,
+            'category': category,
+            'category_color': category_color,
+            'color': category_color,
+            'confidence': confidence,
+            'is_subscription': is_subscription,
+            'subscription_type': subscription_type,
+            'billing_cycle': billing_cycle,
+            'service_logo': service_logo,
+            'is_trial': is_trial,
+            'email_body_preview': body[:200] + "..." if len(body) > 200 else body
+        }
+    
+    def _assemble_message(self, msg_data) -> bytes:
+        """Rebuild a parseable message from the header-field and body sections of a FETCH response"""
+        header, text = b'', b''
+        
+        for item in msg_data:
+            if not isinstance(item, tuple):
+                continue
+            descriptor, payload = item
+            if b'HEADER' in descriptor.upper():
+                header = payload
+            else:
+                text = payload
+        
+        if header and not header.endswith((b'\r\n\r\n', b'\n\n')):
+            header += b'\r\n'
+        
+        return header + text
+    
+    def process_emails(self, max_emails: int = 50, progress_callback=None, start_date: Optional[date] = None,
+                       end_date: Optional[date] = None, result_callback=None) -> List[Dict]:
+        """Process emails with multi-threaded processing; result_callback sees the growing results list"""
         results = []
+        worker_connections = []
+        
+        if not self.ensure_connection():
+            return results
+        
+        # A failed search propagates to the caller rather than looking like an empty inbox
+        message_ids = self.search_bank_emails(max_emails, start_date, end_date)
+        if not message_ids:
+            return results
         
         try:
-            message_ids = self.search_bank_emails(max_emails)
-            total_emails = len(message_ids)
+            results.extend(self.processed_emails[message_id] for message_id in message_ids if message_id in self.processed_emails)
+            message_ids = [message_id for message_id in message_ids if message_id not in self.processed_emails]
             
-            if total_emails == 0:
-                return results
+            if result_callback and results:
+                result_callback(results)
             
-            with ThreadPoolExecutor(max_workers=15, thread_name_prefix="EmailProcessor") as executor:
-                future_to_message_id = {
-                    executor.submit(self.fetch_and_analyze_email, message_id): message_id 
-                    for message_id in message_ids
-                }
+            total_emails = len(message_ids)
+            batches = [message_ids[start:start + self._FETCH_BATCH_SIZE] for start in range(0, total_emails, self._FETCH_BATCH_SIZE)]
+            
+            # With several batches, each fetch thread downloads on its own IMAP session
+            # since a single connection can only serve one command at a time; the first
+            # thread takes the already logged-in shared session instead of opening another
+            worker_local = threading.local()
+            shared_session_taken = threading.Event()
+            
+            def open_worker_connection():
+                worker_local.mail = self._open_connection()
+                if worker_local.mail is not None:
+                    with self.lock:
+                        worker_connections.append(worker_local.mail)
+                return worker_local.mail
+            
+            def fetch_on_worker_connection(batch_ids):
+                if getattr(worker_local, 'mail', None) is None and not getattr(worker_local, 'shared', False):
+                    with self.lock:
+                        worker_local.shared = not shared_session_taken.is_set()
+                        shared_session_taken.set()
+                    if not worker_local.shared:
+                        open_worker_connection()
+                if worker_local.shared:
+                    return self.fetch_email_batch(batch_ids)
+                return self.fetch_email_batch(batch_ids, worker_local.mail, open_worker_connection)
+            
+            with ThreadPoolExecutor(max_workers=self._ANALYSIS_WORKERS, thread_name_prefix="EmailProcessor") as executor, \
+                    ThreadPoolExecutor(max_workers=max(1, min(len(batches), self._FETCH_CONNECTIONS)), thread_name_prefix="EmailFetcher") as fetcher:
+                if len(batches) > 1:
+                    # Futures are dropped as they're consumed, so a batch's raw messages are
+                    # freed once analysed rather than held until every batch has arrived
+                    fetch_futures = {fetcher.submit(fetch_on_worker_connection, batch_ids): len(batch_ids) for batch_ids in batches}
+                    fetched_batches = ((fetch_futures.pop(future), future.result()) for future in as_completed(fetch_futures))
+                else:
+                    fetched_batches = ((len(batch_ids), self.fetch_email_batch(batch_ids)) for batch_ids in batches)
+                
+                # Submit each batch as soon as it arrives so the Replicate calls of earlier
+                # batches are already in flight while later batches are still being fetched;
+                # every task analyses a group of emails with a single prediction
+                future_to_batch_size = {}
+                for batch_size, fetched in fetched_batches:
+                    raw_emails = list(fetched.items())
+                    total_emails -= batch_size - len(raw_emails)
+                    for group_start in range(0, len(raw_emails), self._PROMPT_BATCH_SIZE):
+                        group = raw_emails[group_start:group_start + self._PROMPT_BATCH_SIZE]
+                        future_to_batch_size[executor.submit(self.analyze_email_batch, group)] = len(group)
                 
                 completed_count = 0
                 successful_count = 0
                 
-                for future in as_completed(future_to_message_id):
-                    completed_count += 1
+                for future in as_completed(future_to_batch_size):
+                    completed_count += future_to_batch_size.pop(future)
                     
                     try:
-                        email_data = future.result(timeout=30)
-                        if email_data:
+                        for message_id, email_data in future.result():
                             results.append(email_data)
+                            self.processed_emails[message_id] = email_data
                             successful_count += 1
                     except Exception:
                         pass
                     
                     if progress_callback:
                         progress_callback(completed_count, total_emails)
+                    
+                    if result_callback:
+                        result_callback(results)
                 
         except Exception:
             pass
         finally:
-            if self.mail:
+            # Only the shared session stays open between analyses
+            for connection in worker_connections:
                 try:
-                    self.mail.close()
-                    self.mail.logout()
-                except:
+                    connection.logout()
+                except Exception:
                     pass
         
         return results
@@ -1502,7 +2096,7 @@ class BankEmailExtractor:
         """Enhanced bank identification"""
         sender_lower = sender.lower()
         
-        for bank, identifiers in self.bank_senders.items():
+        for bank, identifiers in self._BANK_SENDERS.items():
             for identifier in identifiers:
                 if identifier.lower() in sender_lower:
                     return bank
@@ -1520,46 +2114,53 @@ class BankEmailExtractor:
             
         return "Unknown Bank"
     
+    def _decode_part(self, part) -> str:
+        """Decode a MIME part's payload once using its declared charset"""
+        payload = part.get_payload(decode=True)
+        if payload is None:
+            return str(part.get_payload())
+        
+        try:
+            return payload.decode(part.get_content_charset() or 'utf-8', errors='replace')
+        except LookupError:
+            return payload.decode('utf-8', errors='replace')
+    
     def extract_email_body(self, email_message) -> str:
         """Enhanced email body extraction"""
         body = ""
         
         if email_message.is_multipart():
+            # Pick the part first and decode only that one: text/plain wins over text/html
+            plain_part = html_part = None
             for part in email_message.walk():
+                if "attachment" in str(part.get("Content-Disposition")):
+                    continue
                 content_type = part.get_content_type()
-                content_disposition = str(part.get("Content-Disposition"))
-                
-                if content_type == "text/plain" and "attachment" not in content_disposition:
-                    try:
-                        body = part.get_payload(decode=True).decode('utf-8')
-                        break
-                    except:
-                        try:
-                            body = part.get_payload(decode=True).decode('latin-1')
-                            break
-                        except:
-                            continue
-                elif content_type == "text/html" and "attachment" not in content_disposition and not body:
-                    try:
-                        html_body = part.get_payload(decode=True).decode('utf-8')
+                if content_type == "text/plain":
+                    plain_part = part
+                    break
+                elif content_type == "text/html" and html_part is None:
+                    html_part = part
+            
+            try:
+                if plain_part is not None:
+                    body = self._decode_part(plain_part)
+                elif html_part is not None:
+                    html_body = self._decode_part(html_part)
+                    if HTMLParser is not None:
+                        body = HTMLParser(html_body).text(separator=' ')
+                        body = _WHITESPACE_RE.sub(' ', body).strip()
+                    else:
                         try:
                             from bs4 import BeautifulSoup
                             soup = BeautifulSoup(html_body, 'html.parser')
                             body = soup.get_text(separator=' ', strip=True)
                         except ImportError:
-                            body = re.sub(r'<[^>]+>', ' ', html_body)
-                            body = re.sub(r'\s+', ' ', body).strip()
-                        break
-                    except:
-                        continue
+                            body = _HTML_TAG_RE.sub(' ', html_body).strip()
+            except Exception:
+                body = ""
         else:
-            try:
-                body = email_message.get_payload(decode=True).decode('utf-8')
-            except:
-                try:
-                    body = email_message.get_payload(decode=True).decode('latin-1')
-                except:
-                    body = str(email_message.get_payload())
+            body = self._decode_part(email_message)
         
         return body[:1500]
 
@@ -1710,6 +2311,52 @@ def create_subscription_visualizations(subscriptions: List[Dict], metrics: Dict)
     
     return fig_monthly, fig_category, fig_yearly
 
+# Thousands separators and currency markers, removed from amount strings in a single pass
+_AMOUNT_NOISE_RE = re.compile(r'[,₹]|Rs\.')
+
+def to_amount_numeric(amounts: pd.Series) -> pd.Series:
+    """Vectorized amount parsing: numeric strings become floats, missing or malformed amounts 0"""
+    cleaned = amounts.astype(str).str.replace(_AMOUNT_NOISE_RE, '', regex=True).str.strip()
+    return pd.to_numeric(cleaned, errors='coerce').fillna(0.0)
+
+_DATE_ISO_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+# Fields of the records built by BankEmailExtractor._build_record
+_TRANSACTION_COLUMNS = (
+    'message_id', 'date', 'date_iso', 'bank', 'subject', 'merchant_name', 'sender', 'amount',
+    'category', 'category_color', 'color', 'confidence', 'is_subscription', 'subscription_type',
+    'billing_cycle', 'service_logo', 'is_trial', 'email_body_preview'
+)
+
+@st.cache_data(show_spinner=False)
+def prepare_transactions_df(transactions: List[Dict]) -> pd.DataFrame:
+    """Build the cleaned transaction frame (positive amounts, parsed dates, newest first), cached across reruns"""
+    # Column lists for the known schema, so pandas builds each column directly instead of walking row dicts
+    df = pd.DataFrame({column: [t.get(column) for t in transactions] for column in _TRANSACTION_COLUMNS})
+    df['amount_numeric'] = to_amount_numeric(df['amount'])
+    df = df[df['amount_numeric'] > 0]
+    # parse_email always writes seconds-precision ISO stamps, so the fixed format skips per-row inference
+    df['date_parsed'] = pd.to_datetime(df['date_iso'], format=_DATE_ISO_FORMAT, errors='coerce')
+    df = df.dropna(subset=['date_parsed'])
+    # A handful of repeating labels: integer codes make the groupbys and category filters cheaper
+    df['category'] = df['category'].astype('category')
+    return df.sort_values('date_parsed', ascending=False)
+
+@st.cache_data(show_spinner=False)
+def export_csv_bytes(df: pd.DataFrame) -> bytes:
+    """CSV export bytes, serialized once per distinct frame rather than on every rerun"""
+    return df.to_csv(index=False).encode()
+
+@st.cache_data(show_spinner=False)
+def export_json_bytes(df: pd.DataFrame) -> bytes:
+    """JSON records export bytes, serialized once per distinct frame rather than on every rerun"""
+    return df.to_json(orient='records', date_format='iso').encode()
+
+@st.cache_data(show_spinner=False)
+def export_subscriptions_json(subscriptions: List[Dict]) -> str:
+    """Pretty-printed subscriptions export, serialized once per distinct list"""
+    return json.dumps(subscriptions, indent=2, default=str)
+
 def apply_date_filter(df: pd.DataFrame) -> pd.DataFrame:
     """Apply date filter from session state if enabled"""
     if st.session_state.get('date_filter_enabled', False):
@@ -1718,83 +2365,107 @@ def apply_date_filter(df: pd.DataFrame) -> pd.DataFrame:
         
         if start_date and end_date:
             if 'date_parsed' in df.columns:
-                mask = (df['date_parsed'].dt.date >= start_date) & (df['date_parsed'].dt.date <= end_date)
-                return df[mask]
+                dates = df['date_parsed']
+                lower = pd.Timestamp(start_date, tz=dates.dt.tz)
+                upper = pd.Timestamp(end_date, tz=dates.dt.tz) + pd.Timedelta(days=1)
+                
+                # Frames sorted by date (either direction) are sliced by binary search
+                if dates.is_monotonic_increasing:
+                    lo, hi = dates.searchsorted([lower, upper])
+                    return df.iloc[lo:hi]
+                if dates.is_monotonic_decreasing:
+                    lo, hi = dates.iloc[::-1].searchsorted([lower, upper])
+                    return df.iloc[len(df) - hi:len(df) - lo]
+                
+                return df[(dates >= lower) & (dates < upper)]
     
     return df
 
-def create_visualizations(df, categorizer):
-    """Create various visualizations for the transaction data with collapsible containers - FIXED VERSION"""
-    
-    df_filtered = apply_date_filter(df)
-    
-    if len(df_filtered) == 0:
-        st.warning("No transactions found in the selected date range.")
-        return None, None, None, None, None, None, None
-    
-    # CRITICAL FIX: Create a copy and ensure date_parsed is datetime
-    df_filtered = df_filtered.copy()
-    
-    # Multiple-layer datetime conversion with error handling
-    if 'date_parsed' in df_filtered.columns:
-        # Check if date_parsed is already datetime
-        if not pd.api.types.is_datetime64_any_dtype(df_filtered['date_parsed']):
-            # Try multiple conversion methods
-            try:
-                # Ensure date_parsed is real datetime
-                    df_filtered['date_parsed'] = pd.to_datetime(
-                        df_filtered['date_parsed'],            # the source column
-                        errors='coerce',                       # turn bad rows into NaT
-                        utc=False                              # keep local time; change if needed
-                    )
+# Columns the charts actually read; selecting them up front avoids copying the full frame
+_VIZ_COLUMNS = ('date_parsed', 'amount_numeric', 'category', 'bank')
 
-                    # Remove rows where the conversion failed
-                    df_filtered = df_filtered.dropna(subset=['date_parsed'])
+_WEEKDAY_ORDER = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
 
-                    # Final safety check
-                    if not pd.api.types.is_datetime64_any_dtype(df_filtered['date_parsed']):
-                        st.error("Date parsing failed – cannot continue.")
-                        st.stop()               # or return / handle gracefully
+# Upper bound on points drawn by the timeline; longer histories are downsampled with LTTB
+_TIMELINE_MAX_POINTS = 2000
 
-            except:
-                try:
-                    # Fallback conversion
-                    df_filtered['date_parsed'] = df_filtered['date_parsed'].apply(
-                        lambda x: pd.to_datetime(x, errors='coerce') if pd.notna(x) else pd.NaT
-                    )
-                except:
-                    st.error("Critical error: Unable to parse dates for visualization")
-                    return None, None, None, None, None, None, None
-        
-        # Remove any rows where date conversion failed
-        df_filtered = df_filtered.dropna(subset=['date_parsed'])
-        
-        # Final validation - ensure we have datetime data
-        if not pd.api.types.is_datetime64_any_dtype(df_filtered['date_parsed']):
-            st.error("Date parsing failed - cannot create visualizations")
-            return None, None, None, None, None, None, None
-            
-    else:
-        st.error("Date column 'date_parsed' not found in data")
-        return None, None, None, None, None, None, None
+def _lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Pick n_out indices with Largest-Triangle-Three-Buckets, keeping the series' visual shape"""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    
+    buckets = np.array_split(np.arange(1, n - 1), n_out - 2)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    
+    previous = 0
+    for i, bucket in enumerate(buckets):
+        following = buckets[i + 1] if i + 1 < len(buckets) else np.array([n - 1])
+        avg_x, avg_y = x[following].mean(), y[following].mean()
+        # Keep the point forming the largest triangle with the last kept point and the next bucket's mean
+        areas = np.abs((x[previous] - avg_x) * (y[bucket] - y[previous]) - (x[previous] - x[bucket]) * (avg_y - y[previous]))
+        previous = bucket[np.argmax(areas)]
+        selected[i + 1] = previous
+    
+    return selected
+
+def _downsample_timeline(df_sorted: pd.DataFrame) -> pd.DataFrame:
+    """Reduce each category's line to its share of _TIMELINE_MAX_POINTS"""
+    if len(df_sorted) <= _TIMELINE_MAX_POINTS:
+        return df_sorted
+    
+    kept = []
+    for _, group in df_sorted.groupby('category', sort=False, observed=True):
+        n_out = max(3, _TIMELINE_MAX_POINTS * len(group) // len(df_sorted))
+        x = group['date_parsed'].to_numpy(dtype='datetime64[ns]').astype(np.int64).astype(np.float64)
+        y = group['amount_numeric'].to_numpy(dtype=np.float64)
+        kept.append(group.iloc[_lttb_indices(x, y, n_out)])
+    
+    return pd.concat(kept).sort_values('date_parsed')
+
+@st.cache_data(show_spinner=False)
+def _compute_chart_aggregates(df_filtered: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    """Sort and group the filtered transactions once for every chart, cached across reruns"""
+    df_sorted = df_filtered.sort_values('date_parsed')
+    dates = df_sorted['date_parsed']
+    amounts = df_sorted['amount_numeric']
+    
+    bank_spending = df_sorted.groupby('bank')['amount_numeric'].sum().reset_index()
+    
+    # Month labels straight from datetime64[M] ('2024-01'); these sort chronologically as strings
+    months = pd.Series(dates.to_numpy().astype('datetime64[M]').astype(str), index=dates.index, name='month')
+    monthly_spending = amounts.groupby([months, df_sorted['category']], observed=True).sum().reset_index()
+    
+    # Category totals roll up from the month x category sums rather than grouping every row again
+    category_amounts = monthly_spending.groupby('category', observed=True)['amount_numeric'].sum().reset_index()
+    
+    heatmap_data = amounts.groupby([dates.dt.day_name().rename('weekday'), dates.dt.isocalendar().week]).sum().reset_index()
+    heatmap_data['weekday'] = pd.Categorical(heatmap_data['weekday'], categories=_WEEKDAY_ORDER, ordered=True)
+    heatmap_data = heatmap_data.sort_values('weekday')
+    
+    hourly_spending = amounts.groupby(dates.dt.hour.rename('hour')).sum().reset_index()
+    
+    return {
+        'timeline': _downsample_timeline(df_sorted),
+        'category_amounts': category_amounts,
+        'monthly_spending': monthly_spending,
+        'bank_spending': bank_spending,
+        'heatmap_data': heatmap_data,
+        'hourly_spending': hourly_spending
+    }
+
+@st.cache_data(show_spinner=False)
+def _build_chart_figures(df_filtered: pd.DataFrame, color_map: Dict[str, str]) -> tuple:
+    """Build every chart figure, cached across reruns; per-chart failures come back as warnings for the caller to show"""
+    # A failed aggregation raises, so st.cache_data stores nothing and the next rerun retries it
+    aggregates = _compute_chart_aggregates(df_filtered)
+    chart_warnings = []
     
-    # Ensure we have data after filtering
-    if df_filtered.empty:
-        st.warning("No valid data after date processing.")
-        return None, None, None, None, None, None, None
-    
-    # Color mapping
-    color_map = {}
-    if hasattr(categorizer, 'category_colors'):
-        color_map = categorizer.category_colors
-    else:
-        unique_categories = df_filtered['category'].unique()
-        colors = px.colors.qualitative.Set3
-        color_map = {cat: colors[i % len(colors)] for i, cat in enumerate(unique_categories)}
+    category_amounts = aggregates['category_amounts']
     
     # 1. Pie Chart - Category Distribution
     try:
-        category_amounts = df_filtered.groupby('category')['amount_numeric'].sum().reset_index()
         fig_pie = px.pie(
             category_amounts,
             names='category', 
@@ -1805,7 +2476,7 @@ def create_visualizations(df, categorizer):
         )
         fig_pie.update_traces(textposition='inside', textinfo='percent+label')
     except Exception as e:
-        st.warning(f"Could not create pie chart: {e}")
+        chart_warnings.append(f"Could not create pie chart: {e}")
         fig_pie = None
     
     # 2. Bar Chart - Total by Category
@@ -1820,14 +2491,13 @@ def create_visualizations(df, categorizer):
         )
         fig_bar.update_layout(xaxis_tickangle=-45)
     except Exception as e:
-        st.warning(f"Could not create bar chart: {e}")
+        chart_warnings.append(f"Could not create bar chart: {e}")
         fig_bar = None
     
     # 3. Timeline Chart
     try:
-        df_sorted = df_filtered.sort_values('date_parsed')
         fig_timeline = px.line(
-            df_sorted, 
+            aggregates['timeline'], 
             x='date_parsed', 
             y='amount_numeric',
             color='category',
@@ -1836,102 +2506,93 @@ def create_visualizations(df, categorizer):
             color_discrete_map=color_map
         )
     except Exception as e:
-        st.warning(f"Could not create timeline chart: {e}")
+        chart_warnings.append(f"Could not create timeline chart: {e}")
         fig_timeline = None
     
-    # 4. Monthly Spending Chart - WITH ENHANCED ERROR HANDLING
+    # 4. Monthly Spending Chart
     try:
-        df_sorted = df_filtered.sort_values('date_parsed').copy()
-        
-        # CRITICAL FIX: Additional validation before using .dt accessor
-        if pd.api.types.is_datetime64_any_dtype(df_sorted['date_parsed']):
-            # Safe to use .dt accessor now
-            df_sorted['month'] = df_sorted['date_parsed'].dt.to_period('M')
-            monthly_spending = df_sorted.groupby(['month', 'category'])['amount_numeric'].sum().reset_index()
-            monthly_spending['month'] = monthly_spending['month'].astype(str)
-            
-            fig_monthly = px.bar(
-                monthly_spending,
-                x='month',
-                y='amount_numeric',
-                color='category',
-                title='Monthly Spending by Category',
-                color_discrete_map=color_map
-            )
-        else:
-            st.warning("Cannot create monthly chart - invalid date format")
-            fig_monthly = None
+        fig_monthly = px.bar(
+            aggregates['monthly_spending'],
+            x='month',
+            y='amount_numeric',
+            color='category',
+            title='Monthly Spending by Category',
+            color_discrete_map=color_map
+        )
     except Exception as e:
-        st.warning(f"Could not create monthly chart: {e}")
+        chart_warnings.append(f"Could not create monthly chart: {e}")
         fig_monthly = None
     
     # 5. Bank Distribution
     try:
-        bank_spending = df_filtered.groupby('bank')['amount_numeric'].sum().reset_index()
         fig_bank = px.pie(
-            bank_spending,
+            aggregates['bank_spending'],
             names='bank',
             values='amount_numeric',
             title='Spending Distribution by Bank'
         )
     except Exception as e:
-        st.warning(f"Could not create bank chart: {e}")
+        chart_warnings.append(f"Could not create bank chart: {e}")
         fig_bank = None
     
-    # 6. Heatmap - WITH ENHANCED ERROR HANDLING
+    # 6. Heatmap
     try:
-        df_heat = df_filtered.copy()
-        
-        # CRITICAL FIX: Validate datetime before using .dt accessor
-        if pd.api.types.is_datetime64_any_dtype(df_heat['date_parsed']):
-            df_heat['weekday'] = df_heat['date_parsed'].dt.day_name()
-            df_heat['week'] = df_heat['date_parsed'].dt.isocalendar().week
-            
-            heatmap_data = df_heat.groupby(['weekday', 'week'])['amount_numeric'].sum().reset_index()
-            
-            weekday_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-            heatmap_data['weekday'] = pd.Categorical(heatmap_data['weekday'], categories=weekday_order, ordered=True)
-            heatmap_data = heatmap_data.sort_values('weekday')
-            
-            fig_heatmap = px.density_heatmap(
-                heatmap_data,
-                x='week',
-                y='weekday',
-                z='amount_numeric',
-                title='Weekly Spending Heatmap',
-                color_continuous_scale='Blues'
-            )
-        else:
-            st.warning("Cannot create heatmap - invalid date format")
-            fig_heatmap = None
+        fig_heatmap = px.density_heatmap(
+            aggregates['heatmap_data'],
+            x='week',
+            y='weekday',
+            z='amount_numeric',
+            title='Weekly Spending Heatmap',
+            color_continuous_scale='Blues'
+        )
     except Exception as e:
-        st.warning(f"Could not create heatmap: {e}")
+        chart_warnings.append(f"Could not create heatmap: {e}")
         fig_heatmap = None
     
-    # 7. Hourly Pattern - WITH ENHANCED ERROR HANDLING
+    # 7. Hourly Pattern
     try:
-        df_hourly = df_filtered.copy()
-        
-        # CRITICAL FIX: Validate datetime before using .dt accessor
-        if pd.api.types.is_datetime64_any_dtype(df_hourly['date_parsed']):
-            df_hourly['hour'] = df_hourly['date_parsed'].dt.hour
-            hourly_spending = df_hourly.groupby('hour')['amount_numeric'].sum().reset_index()
-            
-            fig_hourly = px.bar(
-                hourly_spending,
-                x='hour',
-                y='amount_numeric',
-                title='Hourly Spending Pattern',
-                color_discrete_sequence=['#00CEC9']
-            )
-        else:
-            st.warning("Cannot create hourly chart - invalid date format")
-            fig_hourly = None
+        fig_hourly = px.bar(
+            aggregates['hourly_spending'],
+            x='hour',
+            y='amount_numeric',
+            title='Hourly Spending Pattern',
+            color_discrete_sequence=['#00CEC9']
+        )
     except Exception as e:
-        st.warning(f"Could not create hourly chart: {e}")
+        chart_warnings.append(f"Could not create hourly chart: {e}")
         fig_hourly = None
     
-    return fig_pie, fig_bar, fig_timeline, fig_monthly, fig_bank, fig_heatmap, fig_hourly
+    return (fig_pie, fig_bar, fig_timeline, fig_monthly, fig_bank, fig_heatmap, fig_hourly), chart_warnings
+
+def create_visualizations(df, categorizer):
+    """Create various visualizations for the transaction data with collapsible containers - FIXED VERSION"""
+    
+    if len(df) == 0:
+        st.warning("No transactions found in the selected date range.")
+        return None, None, None, None, None, None, None
+    
+    # Work on the chart columns only; prepare_transactions_df has already parsed and cleaned the dates
+    chart_df = df.loc[:, list(_VIZ_COLUMNS)]
+    
+    # Color mapping, restricted to the categories on screen so the cached figures are keyed on a small dict
+    if hasattr(categorizer, 'color_map_for'):
+        color_map = categorizer.color_map_for(chart_df['category'].unique())
+    else:
+        unique_categories = chart_df['category'].unique()
+        colors = px.colors.qualitative.Set3
+        color_map = {cat: colors[i % len(colors)] for i, cat in enumerate(unique_categories)}
+    
+    try:
+        figures, chart_warnings = _build_chart_figures(chart_df, color_map)
+    except Exception as e:
+        st.warning(f"Could not aggregate transactions for charts: {e}")
+        return None, None, None, None, None, None, None
+    
+    # Warnings are cached with the figures and shown here, outside the cached function
+    for warning in chart_warnings:
+        st.warning(warning)
+    
+    return figures
 
 def create_metric_card(title, value, delta=None):
     """Helper function to create a metric card"""
@@ -1942,14 +2603,22 @@ def create_metric_card(title, value, delta=None):
     </div>
     """, unsafe_allow_html=True)
 
-def display_transaction_card(row, categorizer):
+def card_category_colors(df: pd.DataFrame, categorizer) -> pd.Series:
+    """Resolve every row's category tag color with one vectorized map"""
+    colors = df['category'].astype(object).map(getattr(categorizer, 'category_colors', {}))
+    if 'category_color' in df.columns:
+        colors = colors.fillna(df['category_color'])
+    return colors.fillna('#6C757D')
+
+def display_transaction_card(row, categorizer, category_color: Optional[str] = None):
     """Display a transaction as a card with trial indicators"""
     amount_color = "#FF6B6B" if float(row['amount_numeric']) < 0 else "#4CAF50"
     
-    if hasattr(categorizer, 'category_colors') and row['category'] in categorizer.category_colors:
-        category_color = categorizer.category_colors[row['category']]
-    else:
-        category_color = row.get('category_color', '#6C757D')
+    if category_color is None:
+        if hasattr(categorizer, 'category_colors') and row['category'] in categorizer.category_colors:
+            category_color = categorizer.category_colors[row['category']]
+        else:
+            category_color = row.get('category_color', '#6C757D')
     
     merchant_name = row.get('merchant_name', row['subject'][:50])
     confidence = row.get('confidence', 0)
@@ -1981,6 +2650,146 @@ def display_transaction_card(row, categorizer):
     </div>
     """, unsafe_allow_html=True)
 
+@st.fragment(run_every=0.5)
+def analysis_status_fragment(stats_manager):
+    """Progress of the background email analysis; refreshes on its own and hands off the results when done"""
+    job = st.session_state.get('analysis_job')
+    if job is None:
+        return
+    
+    if not job['future'].done():
+        completed, total = job['completed'], job['total']
+        st.progress(completed / total if total > 0 else 0, text=f"🔄 Processed {completed}/{total} emails...")
+        
+        # Transactions appear as their analyses land
+        partial_results = job['results']
+        if partial_results:
+            st.dataframe(
+                pd.DataFrame(partial_results[-20:], columns=['date', 'bank', 'merchant_name', 'amount', 'category']),
+                use_container_width=True
+            )
+        return
+    
+    del st.session_state.analysis_job
+    
+    # A job from an earlier login (or an extractor since replaced) must not hand its emails to this one
+    if job['extractor'] is not st.session_state.get('extractor'):
+        return
+    
+    try:
+        results = job['future'].result()
+    except Exception as e:
+        results = []
+        st.session_state.analysis_message = ('error', f"❌ Analysis failed: {e}")
+    
+    if results:
+        st.session_state.transaction_data = results
+        st.session_state.results_processed = True
+        st.session_state.categorizer = job['extractor'].categorizer
+        
+        # Record transaction analysis statistics
+        amounts = to_amount_numeric(pd.Series([r.get('amount') for r in results], dtype=object))
+        total_amount = float(amounts[amounts > 0].sum())
+        subscription_count = len([r for r in results if r.get('is_subscription', False)])
+        
+        stats_manager.record_transaction_analysis(total_amount, subscription_count)
+        
+        st.session_state.analysis_message = ('success', f"✅ Successfully processed {len(results)} transactions!")
+    elif 'analysis_message' not in st.session_state:
+        st.session_state.analysis_message = ('warning', "No bank transaction emails found. Please check your email settings or try increasing the email count.")
+    
+    # Rerun the whole page so the results section picks up the new data
+    st.rerun()
+
+@st.fragment
+def transaction_details_fragment(df_display: pd.DataFrame, categorizer):
+    """Transaction filters, cards and export; changing a filter reruns only this section"""
+    st.markdown("### 💳 Transaction Details")
+    
+    # Labels in first-appearance order, read off the categorical's integer codes rather than hashing every row's string
+    category_codes = pd.unique(df_display['category'].cat.codes.to_numpy())
+    category_options = df_display['category'].cat.categories[category_codes[category_codes >= 0]].tolist()
+    bank_options = df_display['bank'].unique()
+    min_amount = float(df_display['amount_numeric'].min())
+    max_amount = float(df_display['amount_numeric'].max())
+    
+    with st.expander("🔍 Filter Transactions"):
+        # Batched in a form: edits are applied together on submit instead of one rerun per change
+        with st.form("transaction_filters"):
+            col1, col2, col3 = st.columns(3)
+            
+            with col1:
+                selected_categories = st.multiselect(
+                    "Filter by Category",
+                    options=category_options,
+                    default=category_options
+                )
+            
+            with col2:
+                selected_banks = st.multiselect(
+                    "Filter by Bank",
+                    options=bank_options,
+                    default=bank_options
+                )
+            
+            with col3:
+                amount_range = st.slider(
+                    "Amount Range",
+                    min_value=min_amount,
+                    max_value=max_amount,
+                    value=(min_amount, max_amount)
+                )
+            
+            st.form_submit_button("Apply Filters")
+    
+    # Apply filters; ones left at their full default selection match every row and are skipped
+    mask = None
+    if len(selected_categories) < len(category_options):
+        mask = df_display['category'].isin(selected_categories)
+    if len(selected_banks) < len(bank_options):
+        bank_mask = df_display['bank'].isin(selected_banks)
+        mask = bank_mask if mask is None else mask & bank_mask
+    if tuple(amount_range) != (min_amount, max_amount):
+        amount_mask = df_display['amount_numeric'].between(amount_range[0], amount_range[1])
+        mask = amount_mask if mask is None else mask & amount_mask
+    
+    filtered_df = df_display if mask is None else df_display[mask]
+    
+    st.write(f"Showing {len(filtered_df)} transactions")
+    
+    # Display transactions as cards
+    shown_df = filtered_df.head(20)
+    for (idx, row), category_color in zip(shown_df.iterrows(), card_category_colors(shown_df, categorizer)):
+        display_transaction_card(row, categorizer, category_color)
+    
+    if len(filtered_df) > 20:
+        st.info(f"Showing first 20 transactions. {len(filtered_df) - 20} more available.")
+    
+    # Export functionality
+    st.markdown("### 📤 Export Data")
+    
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        csv_data = export_csv_bytes(filtered_df)
+        st.download_button(
+            label="📥 Download as CSV",
+            data=csv_data,
+            file_name=f"transactions_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+            mime="text/csv",
+            use_container_width=True
+        )
+    
+    with col2:
+        json_data = export_json_bytes(filtered_df)
+        st.download_button(
+            label="📥 Download as JSON",
+            data=json_data,
+            file_name=f"transactions_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+            mime="application/json",
+            use_container_width=True
+        )
+
 def main():
     """Main Streamlit app"""
     
@@ -2068,7 +2877,7 @@ def main():
             """)
     
     # Configuration management
-    config_manager = ConfigManager()
+    config_manager = get_config_manager()
     if not config_manager.validate_config():
         config_manager.display_config_status()
     
@@ -2133,9 +2942,24 @@ def main():
         # Main application tabs for authenticated users
         st.markdown(f"### Welcome back! 👋 {st.session_state.user_email}")
         
-        tab1, tab2, tab3, tab4 = st.tabs(["📊 Transaction Analysis", "🔄 Subscription Tracker", "📈 Analytics Dashboard", "⚙️ Settings"])
+        tab_labels = ["📊 Transaction Analysis", "🔄 Subscription Tracker", "📈 Analytics Dashboard", "⚙️ Settings"]
+        
+        # st.tabs runs every tab's body on each rerun; a radio lets only the selected view build its charts
+        active_tab = st.radio("View", tab_labels, horizontal=True, key='active_tab', label_visibility='collapsed')
+        
+        # Initialize subscription tracker (used by both the subscription and analytics views)
+        tracker = SubscriptionTracker(config_manager)
+        
+        # Analysis progress and its hand-off run whichever view is selected
+        if 'analysis_job' in st.session_state:
+            analysis_status_fragment(stats_manager)
+        
+        analysis_message = st.session_state.pop('analysis_message', None)
+        if analysis_message:
+            level, text = analysis_message
+            getattr(st, level)(text)
         
-        with tab1:
+        if active_tab == tab_labels[0]:
             st.markdown("## 🔍 AI-Powered Transaction Analysis")
             
             col1, col2 = st.columns([2, 1])
@@ -2144,7 +2968,8 @@ def main():
                 max_emails = st.slider("Number of emails to analyze", 10, 200, 50, 10)
                 
             with col2:
-                analyze_button = st.button("🚀 Analyze Transactions", type="primary", use_container_width=True)
+                analyze_button = st.button("🚀 Analyze Transactions", type="primary", use_container_width=True,
+                                           disabled='analysis_job' in st.session_state)
             
             # Date filter controls
             with st.expander("📅 Date Range Filter (Optional)"):
@@ -2161,54 +2986,43 @@ def main():
                                                value=datetime.now().date(),
                                                key="date_filter_end")
             
-            if analyze_button:
-                with st.spinner("🔄 Processing your bank emails with AI..."):
-                    extractor = st.session_state.extractor
-                    progress_bar = st.progress(0)
-                    status_text = st.empty()
-                    
-                    def update_progress(completed, total):
-                        progress = completed / total if total > 0 else 0
-                        progress_bar.progress(progress)
-                        status_text.text(f"Processed {completed}/{total} emails...")
-                    
-                    results = extractor.process_emails(max_emails, update_progress)
-                    
-                    if results:
-                        st.session_state.transaction_data = results
-                        st.session_state.results_processed = True
-                        st.session_state.categorizer = extractor.categorizer
-                        
-                        # Record transaction analysis statistics
-                        total_amount = sum(float(r.get('amount', 0)) for r in results if r.get('amount') and r.get('amount').replace('.', '').replace(',', '').isdigit())
-                        subscription_count = len([r for r in results if r.get('is_subscription', False)])
-                        
-                        stats_manager.record_transaction_analysis(total_amount, subscription_count)
-                        
-                        st.success(f"✅ Successfully processed {len(results)} transactions!")
-                        progress_bar.empty()
-                        status_text.empty()
-                    else:
-                        st.warning("No bank transaction emails found. Please check your email settings or try increasing the email count.")
+            if analyze_button and 'analysis_job' not in st.session_state:
+                extractor = st.session_state.extractor
+                
+                if 'analysis_executor' not in st.session_state:
+                    st.session_state.analysis_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="EmailAnalysis")
+                
+                # The analysis runs on a worker thread so reruns stay responsive while it waits
+                # on IMAP and Replicate; the callbacks only record plain state for the status fragment
+                job = {'extractor': extractor, 'completed': 0, 'total': 0, 'results': []}
+                
+                def record_progress(completed, total):
+                    job['completed'], job['total'] = completed, total
+                
+                def record_results(partial_results):
+                    job['results'] = partial_results
+                
+                # Push an active date filter down into the IMAP search so out-of-range
+                # emails are never fetched or sent for analysis
+                date_range = ()
+                if st.session_state.get('date_filter_enabled', False):
+                    date_range = (st.session_state.get('date_filter_start'), st.session_state.get('date_filter_end'))
+                
+                job['future'] = st.session_state.analysis_executor.submit(
+                    extractor.process_emails, max_emails, record_progress, *date_range, result_callback=record_results
+                )
+                st.session_state.analysis_job = job
+                st.rerun()
             
             # Display results if available
             if st.session_state.get('results_processed', False) and st.session_state.get('transaction_data'):
                 results = st.session_state.transaction_data
                 categorizer = st.session_state.categorizer
                 
-                # Convert to DataFrame for analysis
-                df = pd.DataFrame(results)
-                
-                # Data cleaning and preparation
-                df['amount_numeric'] = df['amount'].apply(lambda x: float(x) if x and str(x).replace('.', '').replace(',', '').replace('-', '').isdigit() else 0)
-                df = df[df['amount_numeric'] > 0]
+                # Cleaned, date-parsed DataFrame; reused across reruns until the results change
+                df = prepare_transactions_df(results)
                 
                 if len(df) > 0:
-                    # Parse dates
-                    df['date_parsed'] = pd.to_datetime(df['date'], errors='coerce')
-                    df = df.dropna(subset=['date_parsed'])
-                    df = df.sort_values('date_parsed', ascending=False)
-                    
                     # Apply date filter if enabled
                     df_display = apply_date_filter(df)
                     
@@ -2220,16 +3034,18 @@ def main():
                         
                         col1, col2, col3, col4 = st.columns(4)
                         
+                        # One pass over the amounts; prepared frames hold no missing amounts, so the mean is sum / rows
+                        total_amount = float(df_display['amount_numeric'].to_numpy().sum())
+                        transaction_count = len(df_display)
+                        
                         with col1:
-                            total_amount = df_display['amount_numeric'].sum()
                             create_metric_card("Total Amount", f"₹{total_amount:,.2f}")
                         
                         with col2:
-                            transaction_count = len(df_display)
                             create_metric_card("Total Transactions", f"{transaction_count:,}")
                         
                         with col3:
-                            avg_amount = df_display['amount_numeric'].mean()
+                            avg_amount = total_amount / transaction_count
                             create_metric_card("Average Amount", f"₹{avg_amount:,.2f}")
                         
                         with col4:
@@ -2238,10 +3054,12 @@ def main():
                         
                         # Category breakdown
                         st.markdown("### 🏷️ Spending by Category")
-                        category_summary = df_display.groupby('category').agg({
-                            'amount_numeric': ['sum', 'count', 'mean']
+                        # Named aggregation gives flat columns directly; the groupby sort is redundant with the one below
+                        category_summary = df_display.groupby('category', sort=False, observed=True).agg(**{
+                            'Total Amount': ('amount_numeric', 'sum'),
+                            'Transaction Count': ('amount_numeric', 'count'),
+                            'Average Amount': ('amount_numeric', 'mean')
                         }).round(2)
-                        category_summary.columns = ['Total Amount', 'Transaction Count', 'Average Amount']
                         category_summary = category_summary.sort_values('Total Amount', ascending=False)
                         
                         st.dataframe(category_summary, use_container_width=True)
@@ -2292,96 +3110,21 @@ def main():
                                 with col2:
                                     st.plotly_chart(fig_hourly, use_container_width=True)
                         
-                        # Transaction details
-                        st.markdown("### 💳 Transaction Details")
-                        
-                        with st.expander("🔍 Filter Transactions"):
-                            col1, col2, col3 = st.columns(3)
-                            
-                            with col1:
-                                selected_categories = st.multiselect(
-                                    "Filter by Category",
-                                    options=df_display['category'].unique(),
-                                    default=df_display['category'].unique()
-                                )
-                            
-                            with col2:
-                                selected_banks = st.multiselect(
-                                    "Filter by Bank",
-                                    options=df_display['bank'].unique(),
-                                    default=df_display['bank'].unique()
-                                )
-                            
-                            with col3:
-                                amount_range = st.slider(
-                                    "Amount Range",
-                                    min_value=float(df_display['amount_numeric'].min()),
-                                    max_value=float(df_display['amount_numeric'].max()),
-                                    value=(float(df_display['amount_numeric'].min()), float(df_display['amount_numeric'].max()))
-                                )
-                        
-                        # Apply filters
-                        filtered_df = df_display[
-                            (df_display['category'].isin(selected_categories)) &
-                            (df_display['bank'].isin(selected_banks)) &
-                            (df_display['amount_numeric'] >= amount_range[0]) &
-                            (df_display['amount_numeric'] <= amount_range[1])
-                        ]
-                        
-                        st.write(f"Showing {len(filtered_df)} transactions")
-                        
-                        # Display transactions as cards
-                        for idx, row in filtered_df.head(20).iterrows():
-                            display_transaction_card(row, categorizer)
-                        
-                        if len(filtered_df) > 20:
-                            st.info(f"Showing first 20 transactions. {len(filtered_df) - 20} more available.")
-                        
-                        # Export functionality
-                        st.markdown("### 📤 Export Data")
-                        
-                        col1, col2, col3 = st.columns(3)
-                        
-                        with col1:
-                            csv_data = filtered_df.to_csv(index=False)
-                            st.download_button(
-                                label="📥 Download as CSV",
-                                data=csv_data,
-                                file_name=f"transactions_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                                mime="text/csv",
-                                use_container_width=True
-                            )
-                        
-                        with col2:
-                            json_data = filtered_df.to_json(orient='records', date_format='iso')
-                            st.download_button(
-                                label="📥 Download as JSON",
-                                data=json_data,
-                                file_name=f"transactions_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-                                mime="application/json",
-                                use_container_width=True
-                            )
+                        # Transaction details and export rerun on their own when filters change
+                        transaction_details_fragment(df_display, categorizer)
                 else:
                     st.warning("No valid transaction data found in the processed emails.")
         
-        with tab2:
+        elif active_tab == tab_labels[1]:
             st.markdown("## 🔄 Subscription Management")
             
-            # Initialize subscription tracker
-            tracker = SubscriptionTracker(config_manager)
-            
             # Auto-detect subscriptions from transaction data
             if st.session_state.get('results_processed', False) and st.session_state.get('transaction_data'):
                 if st.button("🔍 Auto-Detect Subscriptions from Transactions", type="primary"):
                     with st.spinner("Analyzing transactions for subscription patterns..."):
-                        df = pd.DataFrame(st.session_state.transaction_data)
-                        df['amount_numeric'] = df['amount'].apply(lambda x: float(x) if x and str(x).replace('.', '').replace(',', '').replace('-', '').isdigit() else 0)
-                        df = df[df['amount_numeric'] > 0]
+                        df = prepare_transactions_df(st.session_state.transaction_data)
                         
                         if len(df) > 0:
-                            df['date_parsed'] = pd.to_datetime(df['date'], errors='coerce')
-                            df = df.dropna(subset=['date_parsed'])
-                            
                             detected_subs = tracker.detect_subscriptions_from_transactions(df)
                             
                             if detected_subs:
@@ -2627,7 +3370,7 @@ def main():
                 
                 with col1:
                     subscription_df = pd.DataFrame(st.session_state.subscriptions)
-                    csv_data = subscription_df.to_csv(index=False)
+                    csv_data = export_csv_bytes(subscription_df)
                     st.download_button(
                         label="📥 Download Subscriptions as CSV",
                         data=csv_data,
@@ -2637,7 +3380,7 @@ def main():
                     )
                 
                 with col2:
-                    json_data = json.dumps(st.session_state.subscriptions, indent=2, default=str)
+                    json_data = export_subscriptions_json(st.session_state.subscriptions)
                     st.download_button(
                         label="📥 Download Subscriptions as JSON",
                         data=json_data,
@@ -2648,18 +3391,13 @@ def main():
             else:
                 st.info("💡 No subscriptions found. Add one manually or analyze your transactions to auto-detect subscriptions.")
         
-        with tab3:
+        elif active_tab == tab_labels[2]:
             st.markdown("## 📈 Advanced Analytics Dashboard")
             
             if st.session_state.get('results_processed', False) and st.session_state.get('transaction_data'):
-                df = pd.DataFrame(st.session_state.transaction_data)
-                df['amount_numeric'] = df['amount'].apply(lambda x: float(x) if x and str(x).replace('.', '').replace(',', '').replace('-', '').isdigit() else 0)
-                df = df[df['amount_numeric'] > 0]
+                df = prepare_transactions_df(st.session_state.transaction_data)
                 
                 if len(df) > 0:
-                    df['date_parsed'] = pd.to_datetime(df['date'], errors='coerce')
-                    df = df.dropna(subset=['date_parsed'])
-                    
                     # Apply date filter if enabled
                     df_filtered = apply_date_filter(df)
                     
@@ -2674,10 +3412,11 @@ def main():
                             st.markdown("#### 📊 Spending Distribution")
                             
                             # Top spending categories
-                            top_categories = df_filtered.groupby('category')['amount_numeric'].sum().sort_values(ascending=False).head(5)
+                            top_categories = df_filtered.groupby('category', observed=True)['amount_numeric'].sum().nlargest(5)
+                            total_spent = df_filtered['amount_numeric'].sum()
                             
                             for category, amount in top_categories.items():
-                                percentage = (amount / df_filtered['amount_numeric'].sum()) * 100
+                                percentage = (amount / total_spent) * 100
                                 st.write(f"**{category}:** ₹{amount:,.2f} ({percentage:.1f}%)")
                         
                         with col2:
@@ -2761,8 +3500,9 @@ def main():
                         recommendations = []
                         
                         # High spending categories
-                        top_category = df_filtered.groupby('category')['amount_numeric'].sum().idxmax()
-                        top_amount = df_filtered.groupby('category')['amount_numeric'].sum().max()
+                        category_totals = df_filtered.groupby('category', observed=True)['amount_numeric'].sum()
+                        top_category = category_totals.idxmax()
+                        top_amount = category_totals.max()
                         
                         if top_amount > df_filtered['amount_numeric'].sum() * 0.3:
                             recommendations.append(f"🎯 Consider reducing spending in **{top_category}** - it accounts for a large portion of your expenses")
@@ -2799,7 +3539,7 @@ def main():
             else:
                 st.info("💡 Please analyze your transactions first to see advanced analytics.")
         
-        with tab4:
+        elif active_tab == tab_labels[3]:
             st.markdown("## ⚙️ Settings & Configuration")
             
             # Account information
@@ -2812,9 +3552,17 @@ def main():
             col1, col2 = st.columns(2)
             
             with col1:
-                if st.button("🗑️ Clear Transaction Data", type="secondary"):
+                # The analysis worker reads and writes the same caches, so clearing waits for it to finish
+                if st.button("🗑️ Clear Transaction Data", type="secondary",
+                             disabled='analysis_job' in st.session_state):
                     st.session_state.transaction_data = []
                     st.session_state.results_processed = False
+                    if 'extractor' in st.session_state:
+                        st.session_state.extractor.processed_emails.clear()
+                        categorizer = st.session_state.extractor.categorizer
+                        if categorizer is not None:
+                            with categorizer.analysis_cache_lock:
+                                categorizer.analysis_cache.clear()
                     st.success("✅ Transaction data cleared!")
             
             with col2:
@@ -2866,6 +3614,18 @@ def main():
                 st.session_state.transaction_data = []
                 st.session_state.results_processed = False
                 st.session_state.subscriptions = []
+                
+                # Drop any analysis still in flight so its results never reach the next login
+                extractor = st.session_state.pop('extractor', None)
+                job = st.session_state.pop('analysis_job', None)
+                executor = st.session_state.pop('analysis_executor', None)
+                if executor is not None:
+                    executor.shutdown(wait=False, cancel_futures=True)
+                if job is not None and not job['future'].cancel():
+                    # The worker is still on the IMAP session; close it once the worker lets go
+                    job['future'].add_done_callback(lambda _: job['extractor'].logout())
+                elif extractor is not None:
+                    extractor.logout()
                 st.success("✅ Successfully logged out!")
                 st.rerun()
 